@@ -0,0 +1,132 @@
+"""
+Background account deletion.
+
+/delete-account only marks the user deleted (so login and tokens stop
+working at once) and records an account_deletions row. A worker then purges
+the account's analyses in chunks of CHUNK_SIZE rows, each chunk in its own
+short transaction, recording progress on that row. When nothing is left it
+deletes the user's tokens, analysis stats and the users row, and clears the
+email from the job row. All state lives in the database, so an interrupted
+purge resumes after a restart. Every worker process runs a DeletionWorker;
+each chunk claims the job row with FOR UPDATE SKIP LOCKED, so two workers
+never purge the same account at once.
+"""
+
+import os
+import asyncio
+from datetime import datetime
+from sqlalchemy import func
+from database import SessionLocal, User, Analysis, AnalysisDetail, AnalysisStat, AuthToken, AccountDeletion
+import auth_cache
+
+CHUNK_SIZE = int(os.getenv("ACCOUNT_DELETE_CHUNK", "500"))
+POLL_SECONDS = 60
+
+
+async def request_deletion(db, user):
+    """Mark user deleted in the caller's (async) transaction and queue the purge."""
+    now = datetime.utcnow()
+    user.deleted_at = now
+    if await db.get(AccountDeletion, user.id) is None:
+        db.add(AccountDeletion(user_id=user.id, email=user.email, status="pending", analyses_deleted=0, requested_at=now, updated_at=now))
+
+
+def purge_chunk(user_id: int, chunk: int = CHUNK_SIZE) -> bool:
+    """Delete up to chunk analyses (or finish the account); returns True when done
+    or when another worker holds the job."""
+    db = SessionLocal()
+    try:
+        job = (
+            db.query(AccountDeletion)
+            .filter(AccountDeletion.user_id == user_id, AccountDeletion.status == "pending")
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            return True
+        ids = [i for (i,) in db.query(Analysis.id).filter(Analysis.user_id == user_id).order_by(Analysis.id).limit(chunk)]
+        now = datetime.utcnow()
+        if ids:
+            db.query(AnalysisDetail).filter(AnalysisDetail.analysis_id.in_(ids)).delete(synchronize_session=False)
+            deleted = db.query(Analysis).filter(Analysis.id.in_(ids)).delete(synchronize_session=False)
+            job.analyses_deleted += deleted
+            job.updated_at = now
+            db.commit()
+            return False
+        email = job.email
+        # Rows written before analyses.user_id existed still reference the email.
+        legacy = db.query(Analysis.id).filter(Analysis.user_id.is_(None), Analysis.user_email == email)
+        db.query(AnalysisDetail).filter(AnalysisDetail.analysis_id.in_(legacy.scalar_subquery())).delete(synchronize_session=False)
+        job.analyses_deleted += db.query(Analysis).filter(Analysis.user_id.is_(None), Analysis.user_email == email).delete(synchronize_session=False)
+        db.query(AuthToken).filter(AuthToken.user_id == user_id).delete(synchronize_session=False)
+        db.query(AnalysisStat).filter(AnalysisStat.user_id == user_id).delete(synchronize_session=False)
+        db.query(User).filter(User.id == user_id).delete(synchronize_session=False)
+        job.status = "done"
+        job.email = None
+        job.updated_at = job.completed_at = now
+        db.commit()
+        auth_cache.invalidate_user(email)
+        print(f"Account {user_id} purged ({job.analyses_deleted} analyses)")
+        return True
+    finally:
+        db.close()
+
+
+def pending_ids() -> list:
+    db = SessionLocal()
+    try:
+        return [i for (i,) in db.query(AccountDeletion.user_id).filter(AccountDeletion.status == "pending").order_by(AccountDeletion.requested_at)]
+    finally:
+        db.close()
+
+
+def stats() -> dict:
+    db = SessionLocal()
+    try:
+        counts = dict(db.query(AccountDeletion.status, func.count(AccountDeletion.user_id)).group_by(AccountDeletion.status).all())
+    finally:
+        db.close()
+    return {"pending": counts.get("pending", 0), "done": counts.get("done", 0)}
+
+
+class DeletionWorker:
+    def __init__(self, poll_seconds: float = POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._wake = asyncio.Event()
+        self._task = None
+        self._loop = None
+
+    async def drain(self):
+        for user_id in await asyncio.to_thread(pending_ids):
+            while not await asyncio.to_thread(purge_chunk, user_id):
+                await asyncio.sleep(0)  # let requests run between chunks
+
+    async def _run(self):
+        while True:
+            try:
+                await self.drain()
+            except Exception as e:
+                print(f"Account deletion error: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def notify(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+worker = DeletionWorker()
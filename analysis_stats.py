@@ -0,0 +1,138 @@
+"""
+Per-user analysis counts for the dashboard.
+
+analysis_stats holds one row per (user, month, trend, confidence) with a
+count. Whoever inserts or deletes an Analysis calls increment_async() or
+decrement() in the same transaction, so the rollup never drifts from the raw rows and
+summary() reads a handful of rows instead of scanning analyses.
+
+rebuild() recomputes users from scratch; migration 10 uses it as the
+backfill, and it can be rerun at any time:
+
+    python analysis_stats.py --rebuild
+"""
+
+import sys
+from datetime import datetime
+from sqlalchemy import select, update, delete, text
+from sqlalchemy.dialects import postgresql, sqlite
+from database import AnalysisStat, User
+
+REBUILD_BATCH = 500  # users per transaction
+TRENDS = ("bullish", "bearish", "sideways")
+CONFIDENCE_LEVELS = ("high", "medium", "low")
+UNKNOWN = "unknown"
+
+
+def normalize_trend(value) -> str:
+    value = (value or "").strip().lower()
+    return value if value in TRENDS else UNKNOWN
+
+
+def normalize_confidence(value) -> str:
+    """Map free-text model output ("Confidence: High", ...) to a fixed level."""
+    value = (value or "").lower()
+    for level in CONFIDENCE_LEVELS:
+        if level in value:
+            return level
+    return UNKNOWN
+
+
+def _key(analysis) -> dict:
+    ts = analysis.created_at or datetime.utcnow()
+    return {"user_id": analysis.user_id, "period": ts.strftime("%Y-%m"),
+            "trend": normalize_trend(analysis.trend), "confidence": normalize_confidence(analysis.confidence)}
+
+
+def _increment_stmt(dialect: str, key: dict):
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(AnalysisStat).values(**key, count=1)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "period", "trend", "confidence"],
+        set_={"count": AnalysisStat.count + 1},
+    )
+
+
+def _decrement_stmt(key: dict):
+    return (
+        update(AnalysisStat)
+        .where(*(getattr(AnalysisStat, k) == v for k, v in key.items()), AnalysisStat.count > 0)
+        .values(count=AnalysisStat.count - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def increment_async(db, analysis):
+    if analysis.user_id is not None:
+        await db.execute(_increment_stmt(db.bind.dialect.name, _key(analysis)))
+
+
+def decrement(db, analysis):
+    if analysis.user_id is not None:
+        db.execute(_decrement_stmt(_key(analysis)))
+
+
+def summary(db, user_id: int) -> dict:
+    """Dashboard totals for user_id, from the rollup rows only."""
+    rows = db.execute(
+        select(AnalysisStat.period, AnalysisStat.trend, AnalysisStat.confidence, AnalysisStat.count)
+        .where(AnalysisStat.user_id == user_id, AnalysisStat.count > 0)
+    ).all()
+    out = {"total": 0, "by_trend": {}, "by_confidence": {}, "by_period": {}}
+    for period, trend, confidence, count in rows:
+        out["total"] += count
+        for field, value in (("by_trend", trend), ("by_confidence", confidence), ("by_period", period)):
+            out[field][value] = out[field].get(value, 0) + count
+    out["by_period"] = dict(sorted(out["by_period"].items()))
+    return out
+
+
+def _period_expr(dialect: str):
+    if dialect == "postgresql":
+        return "to_char(created_at, 'YYYY-MM')"
+    return "strftime('%Y-%m', created_at)"
+
+
+def _trend_expr() -> str:
+    known = ", ".join(f"'{t}'" for t in TRENDS)
+    return f"CASE WHEN LOWER(trend) IN ({known}) THEN LOWER(trend) ELSE '{UNKNOWN}' END"
+
+
+def _confidence_expr() -> str:
+    # Same first-match order as normalize_confidence, for rows written before it.
+    whens = " ".join(f"WHEN LOWER(confidence) LIKE '%{level}%' THEN '{level}'" for level in CONFIDENCE_LEVELS)
+    return f"CASE {whens} ELSE '{UNKNOWN}' END"
+
+
+def rebuild(conn, batch: int = REBUILD_BATCH) -> int:
+    """Recompute the rollup for every user, batch users per transaction."""
+    period, trend, confidence = _period_expr(conn.dialect.name), _trend_expr(), _confidence_expr()
+    refill = text(
+        "INSERT INTO analysis_stats (user_id, period, trend, confidence, count) "
+        f"SELECT user_id, {period}, {trend}, {confidence}, COUNT(*) "
+        "FROM analyses WHERE user_id > :lo AND user_id <= :hi "
+        f"GROUP BY user_id, {period}, {trend}, {confidence}"
+    )
+    rebuilt, last = 0, 0
+    while True:
+        if conn.in_transaction():
+            conn.commit()
+        with conn.begin():
+            ids = conn.execute(select(User.id).where(User.id > last).order_by(User.id).limit(batch)).scalars().all()
+            if not ids:
+                break
+            hi = ids[-1]
+            conn.execute(delete(AnalysisStat).where(AnalysisStat.user_id > last, AnalysisStat.user_id <= hi))
+            conn.execute(refill, {"lo": last, "hi": hi})
+        rebuilt += len(ids)
+        last = hi
+    return rebuilt
+
+
+if __name__ == "__main__":
+    if "--rebuild" in sys.argv:
+        from database import engine
+        with engine.connect() as conn:
+            print(f"Rebuilt analysis stats for {rebuild(conn)} users")
+    else:
+        print(__doc__)
@@ -0,0 +1,137 @@
+"""
+Short-lived caches for get_current_user.
+
+Verified JWT claims are cached per token, and a detached snapshot of each
+user row per email. On a hit, get_current_user skips both jwt.decode and the
+users SELECT; the snapshot is merged into the request session without a
+load, so handlers that modify the user still get a normal ORM object.
+
+Anything that changes a user (plan, password, profile, usage, deletion)
+must call invalidate_user(email). Other workers converge within USER_TTL.
+invalidate_user also marks the user as recently written (note_write), which
+keeps their reads on the primary until any replica has caught up.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy.orm import make_transient_to_detached
+from database import User, REPLICA_MAX_LAG, REPLICA_CHECK_SECONDS
+
+TOKEN_TTL = int(os.getenv("AUTH_CACHE_TOKEN_TTL", "300"))
+USER_TTL = int(os.getenv("AUTH_CACHE_USER_TTL", "30"))
+MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+
+class TTLCache:
+    """Size-bounded LRU with per-entry expiry."""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_tokens = TTLCache(MAX_ENTRIES, TOKEN_TTL)
+_users = TTLCache(MAX_ENTRIES, USER_TTL)
+_writes = TTLCache(MAX_ENTRIES, REPLICA_MAX_LAG + REPLICA_CHECK_SECONDS)
+_stats = {"user_hits": 0, "user_misses": 0, "token_hits": 0, "token_misses": 0}
+
+
+def token_subject(token: str):
+    email = _tokens.get(token)
+    _stats["token_hits" if email else "token_misses"] += 1
+    return email
+
+
+def remember_token(token: str, email: str, exp=None):
+    ttl = None
+    if exp:
+        # Never trust a cached token past its own expiry.
+        ttl = float(exp) - time.time()
+    _tokens.set(token, email, ttl)
+
+
+def _snapshot(user: User) -> User:
+    copy = User(**{c.key: getattr(user, c.key) for c in User.__table__.columns})
+    make_transient_to_detached(copy)
+    return copy
+
+
+def get_user(db, email: str):
+    """Session-bound user for email from the cache, or None on a miss."""
+    snapshot = _users.get(email)
+    if snapshot is None:
+        _stats["user_misses"] += 1
+        return None
+    _stats["user_hits"] += 1
+    return db.merge(snapshot, load=False)
+
+
+async def get_user_async(db, email: str):
+    """get_user for an AsyncSession."""
+    snapshot = _users.get(email)
+    if snapshot is None:
+        _stats["user_misses"] += 1
+        return None
+    _stats["user_hits"] += 1
+    return await db.merge(snapshot, load=False)
+
+
+def put_user(user: User):
+    _users.set(user.email, _snapshot(user))
+
+
+def note_write(email: str):
+    if email:
+        _writes.set(email, True)
+
+
+def recently_written(email: str) -> bool:
+    return bool(email) and _writes.get(email) is not None
+
+
+def invalidate_user(email: str):
+    if email:
+        _users.pop(email)
+        note_write(email)
+
+
+def stats() -> dict:
+    # Each user hit is one users SELECT (one DB round trip) not issued.
+    return {**_stats, "db_round_trips_saved": _stats["user_hits"], "cached_users": len(_users), "cached_tokens": len(_tokens)}
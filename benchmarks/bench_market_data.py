@@ -0,0 +1,195 @@
+"""
+Market data benchmarks replayed from recorded OHLCV fixtures (no network).
+
+    python benchmarks/bench_market_data.py                    # run, compare to baseline
+    python benchmarks/bench_market_data.py --save-baseline    # accept current numbers
+    python benchmarks/bench_market_data.py --record           # re-record fixtures from Yahoo
+
+Fixtures are gzipped CSVs in the shape yfinance's Ticker.history() returns.
+Each case reports throughput, latency percentiles and tracemalloc peak memory;
+results are written as JSON and compared per case against baseline.json.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+os.environ.setdefault("OHLCV_CACHE_ENABLED", "0")
+
+import pandas as pd
+import market_data
+from market_data import calculate_indicators, detect_asset_type, get_yfinance_data
+
+FIXTURES_DIR = os.path.join(HERE, "fixtures")
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(HERE, "results", "latest.json")
+
+FIXTURE_SYMBOLS = {"AAPL": "AAPL", "BTC-USD": "BTCUSDT", "EURUSD=X": "EURUSD", "GC=F": "XAUUSD"}
+BAR_COUNTS = [100, 500, 2000]
+SYMBOL_COUNTS = [1, 4, 16]
+DETECT_SYMBOLS = [
+    "BTCUSDT", "ETHUSDT", "SOLUSDT", "BTCEUR", "EURUSD", "GBPJPY", "USDTRY", "XAUUSD",
+    "XAGUSD", "GC=F", "AAPL", "TSLA", "NASDAQ", "SP500", "DOGEUSDT", "MSFT",
+]
+
+
+def fixture_path(yf_symbol: str) -> str:
+    return os.path.join(FIXTURES_DIR, yf_symbol.replace("=", "_") + ".csv.gz")
+
+
+def load_fixture(yf_symbol: str) -> pd.DataFrame:
+    df = pd.read_csv(fixture_path(yf_symbol), index_col=0)
+    df.index = pd.to_datetime(df.index, utc=True)
+    return df
+
+
+def record_fixtures(bars: int = max(BAR_COUNTS)):
+    import yfinance as yf
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for yf_symbol in FIXTURE_SYMBOLS:
+        df = yf.Ticker(yf_symbol).history(period="2y", interval="1h").tail(bars)
+        df.to_csv(fixture_path(yf_symbol))
+        print(f"Recorded {yf_symbol}: {len(df)} bars")
+
+
+class ReplayTicker:
+    """Stands in for yf.Ticker and serves a recorded history() frame."""
+
+    frames = {}
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    def history(self, period=None, interval=None, start=None):
+        df = self.frames[self.symbol].copy()
+        # Slide the recording so its last bar is "now" and survives the period window.
+        df.index = df.index + (pd.Timestamp.now(tz="UTC") - df.index[-1])
+        return df
+
+
+def measure(fn, calls: list, repeat: int) -> dict:
+    for args in calls[:2]:
+        fn(*args)  # warm-up
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for args in calls:
+            t = time.perf_counter()
+            fn(*args)
+            latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    # Memory is traced in a separate pass: tracemalloc distorts timings.
+    tracemalloc.start()
+    for args in calls:
+        fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 4)
+
+    return {
+        "calls": len(latencies),
+        "throughput_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": pct(0.50),
+        "p90_ms": pct(0.90),
+        "p99_ms": pct(0.99),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run(repeat: int) -> dict:
+    frames = {s: load_fixture(s) for s in FIXTURE_SYMBOLS}
+    symbols = list(FIXTURE_SYMBOLS)
+    market_data.yf.Ticker = ReplayTicker
+    cases = {}
+
+    for bars in BAR_COUNTS:
+        for n_symbols in SYMBOL_COUNTS:
+            picked = [symbols[i % len(symbols)] for i in range(n_symbols)]
+            # Replay through the same parsing path get_yfinance_data uses.
+            ReplayTicker.frames = {s: frames[s].tail(bars) for s in symbols}
+            # "1w" maps to a 2y window, wide enough to keep every recorded bar.
+            yf_calls = [(FIXTURE_SYMBOLS[s], "1w") for s in picked]
+            cases[f"get_yfinance_data/bars={bars}/symbols={n_symbols}"] = measure(get_yfinance_data, yf_calls, repeat)
+
+            lowered = {s: ReplayTicker.frames[s].rename(columns=str.lower) for s in symbols}
+            ind_calls = [(lowered[s], FIXTURE_SYMBOLS[s]) for s in picked]
+            cases[f"calculate_indicators/bars={bars}/symbols={n_symbols}"] = measure(calculate_indicators, ind_calls, repeat)
+
+    detect_calls = [(s,) for s in DETECT_SYMBOLS]
+    cases[f"detect_asset_type/symbols={len(DETECT_SYMBOLS)}"] = measure(detect_asset_type, detect_calls, repeat * 50)
+    return cases
+
+
+def compare(cases: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for name, result in cases.items():
+        base = baseline.get("cases", {}).get(name)
+        if not base or not base.get("p50_ms"):
+            continue
+        ratio = result["p50_ms"] / base["p50_ms"]
+        result["p50_vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append((name, base["p50_ms"], result["p50_ms"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=0.20, help="allowed p50 slowdown vs baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--record", action="store_true")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures()
+        return 0
+
+    cases = run(args.repeat)
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cases": cases,
+    }
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(cases, json.load(f), args.threshold)
+    report["regressions"] = [name for name, *_ in regressions]
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(f"{'case':<52} {'ops/s':>10} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'peak KB':>9} {'vs base':>8}")
+    for name, r in cases.items():
+        vs = f"{r['p50_vs_baseline']:.2f}x" if "p50_vs_baseline" in r else "-"
+        print(f"{name:<52} {r['throughput_per_s']:>10} {r['p50_ms']:>9} {r['p90_ms']:>9} {r['p99_ms']:>9} {r['peak_kb']:>9} {vs:>8}")
+    for name, base, now, ratio in regressions:
+        print(f"REGRESSION {name}: p50 {base}ms -> {now}ms ({ratio:.2f}x)")
+    print(f"Results written to {args.output}")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,14 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import create_engine, event, exc, text, Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Index, LargeBinary
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship, deferred
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from datetime import datetime
 import os
+import time
+import zlib
+import threading
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -10,10 +16,225 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgresql://"):
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg2://", 1)
 
-engine = create_engine(DATABASE_URL)
+def _async_url(url):
+    """Same database through an asyncio driver (asyncpg / aiosqlite)."""
+    if url.startswith("postgresql+psycopg2://"):
+        return url.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+# Pool sizing. Each worker process has two engines (sync + async), so by default
+# the DB_MAX_CONNECTIONS budget is split across WEB_CONCURRENCY workers and
+# then between the engines, half as steady pool and half as burst overflow.
+# pre_ping + recycle discard connections the Railway proxy dropped while idle.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "40"))
+_PER_ENGINE = max(2, DB_MAX_CONNECTIONS // WEB_CONCURRENCY // 2)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(max(1, _PER_ENGINE // 2))))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", str(_PER_ENGINE - _PER_ENGINE // 2)))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") != "0"
+SLOW_CHECKOUT_SECONDS = 0.1
+
+
+class PoolMetrics:
+    """Checkout latency, overflow and timeout counters for one engine's pool."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.invalidations = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_in_use = 0
+
+    def record_checkout(self, seconds: float, in_use: int, overflow: int):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.peak_in_use = max(self.peak_in_use, in_use)
+            if seconds >= SLOW_CHECKOUT_SECONDS:
+                self.slow_checkouts += 1
+            if overflow > 0:
+                self.overflow_checkouts += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_invalidation(self, *args):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        live = {}
+        if pool is not None and hasattr(pool, "checkedout"):
+            live = {"size": pool.size(), "in_use": pool.checkedout(), "idle": pool.checkedin(),
+                    "overflow": max(0, pool.overflow())}
+        with self._lock:
+            return {
+                **live,
+                "checkouts": self.checkouts,
+                "checkout_wait_avg_ms": round(1000 * self.wait_total / self.checkouts, 3) if self.checkouts else 0,
+                "checkout_wait_max_ms": round(1000 * self.wait_max, 3),
+                "slow_checkouts": self.slow_checkouts,
+                "overflow_checkouts": self.overflow_checkouts,
+                "timeouts": self.timeouts,
+                "invalidations": self.invalidations,
+                "peak_in_use": self.peak_in_use,
+            }
+
+
+class _MeteredPool:
+    metrics = None
+
+    def connect(self):
+        self.metrics.pool = self
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start, self.checkedout(), self.overflow())
+        return conn
+
+
+def _engine_options(url: str, pool_class, name: str) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return options  # in-memory SQLite keeps its single-connection pool
+    # Subclass per engine so pool.recreate() (dispose) keeps the same metrics.
+    metered = type(f"Metered{pool_class.__name__}", (_MeteredPool, pool_class), {"metrics": PoolMetrics(name)})
+    options.update(poolclass=metered, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                   pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE)
+    return options
+
+
+def _watch(target, options: dict) -> PoolMetrics:
+    pool_class = options.get("poolclass")
+    metrics = pool_class.metrics if pool_class is not None else PoolMetrics("unpooled")
+    metrics.pool = target.pool
+    event.listen(target, "invalidate", metrics.record_invalidation)
+    event.listen(target, "soft_invalidate", metrics.record_invalidation)
+    return metrics
+
+
+def _enforce_foreign_keys(target):
+    """SQLite leaves FK constraints (and ON DELETE CASCADE) off per connection."""
+    if target.dialect.name != "sqlite":
+        return
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    event.listen(target, "connect", on_connect)
+
+
+_sync_options = _engine_options(DATABASE_URL, QueuePool, "sync")
+engine = create_engine(DATABASE_URL, **_sync_options)
+_enforce_foreign_keys(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async endpoints use this path so queries never block the event loop.
+# expire_on_commit=False: attributes stay readable after commit without lazy IO.
+_async_options = _engine_options(ASYNC_DATABASE_URL, AsyncAdaptedQueuePool, "async")
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_async_options)
+_enforce_foreign_keys(async_engine.sync_engine)
+POOL_METRICS = {"sync": _watch(engine, _sync_options), "async": _watch(async_engine.sync_engine, _async_options)}
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+# Optional read replicas (comma-separated URLs). Read-only endpoints take
+# sessions from ReplicaRouter; everything that writes stays on SessionLocal.
+REPLICA_URLS = [u.strip().replace("postgresql://", "postgresql+psycopg2://", 1) for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "5"))
+
+
+def replica_lag(conn) -> float:
+    """Seconds the replica is behind; 0 when it has replayed all it received."""
+    if conn.dialect.name != "postgresql":
+        return 0.0
+    return float(conn.execute(text(
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )).scalar() or 0)
+
+
+class ReplicaRouter:
+    """Round-robins reads over replicas within max_lag, falling back to the primary."""
+
+    def __init__(self, primary, replicas: dict, max_lag: float = REPLICA_MAX_LAG,
+                 check_seconds: float = REPLICA_CHECK_SECONDS, lag_probe=replica_lag):
+        self.primary = primary           # sessionmaker
+        self.replicas = replicas         # name -> sessionmaker
+        self.max_lag = max_lag
+        self.check_seconds = check_seconds
+        self.lag_probe = lag_probe
+        self.lag = {name: None for name in replicas}      # None until probed; inf when unreachable
+        self._checked = {name: 0.0 for name in replicas}
+        self._next = 0
+        self._lock = threading.Lock()
+        self.stats_counts = {"replica_reads": 0, "primary_reads": 0, "fallbacks": 0}
+
+    def _probe(self, name: str) -> float:
+        now = time.monotonic()
+        if now - self._checked[name] < self.check_seconds and self.lag[name] is not None:
+            return self.lag[name]
+        self._checked[name] = now
+        try:
+            with self.replicas[name].kw["bind"].connect() as conn:
+                lag = self.lag_probe(conn)
+        except Exception as e:
+            print(f"Replica {name} unavailable: {e}")
+            lag = float("inf")
+        self.lag[name] = lag
+        return lag
+
+    def read_session(self, prefer_primary: bool = False):
+        if self.replicas and not prefer_primary:
+            names = list(self.replicas)
+            with self._lock:
+                start = self._next
+                self._next = (self._next + 1) % len(names)
+            for i in range(len(names)):
+                name = names[(start + i) % len(names)]
+                if self._probe(name) <= self.max_lag:
+                    self.stats_counts["replica_reads"] += 1
+                    return self.replicas[name](info={"replica": name})
+            self.stats_counts["fallbacks"] += 1
+        self.stats_counts["primary_reads"] += 1
+        return self.primary()
+
+    def stats(self) -> dict:
+        return {**self.stats_counts, "max_lag": self.max_lag,
+                "lag_seconds": {n: (None if v is None or v == float("inf") else round(v, 3)) for n, v in self.lag.items()},
+                "healthy": [n for n, v in self.lag.items() if v is not None and v <= self.max_lag]}
+
+
+_replica_sessions = {}
+for _i, _url in enumerate(REPLICA_URLS):
+    _name = f"replica{_i}"
+    _options = _engine_options(_url, QueuePool, _name)
+    _replica_engine = create_engine(_url, **_options)
+    _enforce_foreign_keys(_replica_engine)
+    POOL_METRICS[_name] = _watch(_replica_engine, _options)
+    _replica_sessions[_name] = sessionmaker(autocommit=False, autoflush=False, bind=_replica_engine)
+read_router = ReplicaRouter(SessionLocal, _replica_sessions)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -23,25 +244,124 @@ class User(Base):
     plan = Column(String, default="free")
     analyses_used = Column(Integer, default=0)
     analyses_limit = Column(Integer, default=3)
+    analyses_reserved = Column(Integer, default=0)  # quota slices held by workers (see quota.py)
+    reserved_until = Column(DateTime, nullable=True)
+    deleted_at = Column(DateTime, nullable=True)  # set when deletion is requested; row purged later
     subscription_status = Column(String, default="inactive")
     subscription_id = Column(String, nullable=True)
     plan_started_at = Column(DateTime, nullable=True)
     plan_ends_at = Column(DateTime, nullable=True)
     last_reset_at = Column(DateTime, nullable=True)
     is_verified = Column(Boolean, default=False)
-    verification_token = Column(String, nullable=True)
-    reset_token = Column(String, nullable=True)
-    reset_token_expires = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class AuthToken(Base):
+    """Single-use email verification / password reset token, stored as a SHA-256 hash."""
+    __tablename__ = "auth_tokens"
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    purpose = Column(String(32), nullable=False)  # verify_email | reset_password
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_auth_tokens_expires", "expires_at"), Index("ix_auth_tokens_user_purpose", "user_id", "purpose"))
+
+class AccountDeletion(Base):
+    """Progress of a background account purge; survives restarts."""
+    __tablename__ = "account_deletions"
+    user_id = Column(Integer, primary_key=True)
+    email = Column(String, nullable=True)  # cleared once the purge is done
+    status = Column(String(16), default="pending", nullable=False)  # pending | done
+    analyses_deleted = Column(Integer, default=0, nullable=False)
+    requested_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+    __table_args__ = (Index("ix_account_deletions_status", "status"),)
+
+class CompressedText(TypeDecorator):
+    """Text stored zlib-compressed; compression is transparent to callers."""
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return zlib.compress(value.encode("utf-8"), 6) if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return zlib.decompress(value).decode("utf-8") if value is not None else None
+
 class Analysis(Base):
     __tablename__ = "analyses"
     id = Column(Integer, primary_key=True, index=True)
-    user_email = Column(String, ForeignKey("users.email"))
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    user_email = Column(String, ForeignKey("users.email"))  # legacy; queries use user_id
     trend = Column(String)
     confidence = Column(String)
-    analysis_text = Column(Text)
+    preview = Column(String(200))
+    # Legacy inline text: only rows written before analysis_details existed use
+    # it. Deferred so ordinary Analysis queries never load it.
+    analysis_text = deferred(Column(Text))
     created_at = Column(DateTime, default=datetime.utcnow)
+    # The FK cascades on delete, so deleting an Analysis does not load its detail first.
+    detail = relationship("AnalysisDetail", uselist=False, cascade="all, delete-orphan", lazy="select", passive_deletes=True)
+    # Serves history pages: WHERE user_id = ? ORDER BY created_at DESC, id DESC.
+    # The user_email index serves rows not yet backfilled (main.analyses_of).
+    __table_args__ = (
+        Index("ix_analyses_user_id_created", "user_id", "created_at", "id"),
+        Index("ix_analyses_user_created", "user_email", "created_at", "id"),
+        # Rows not yet backfilled with user_id (empty after migrations.py --backfill).
+        Index("ix_analyses_legacy_email", "user_email", "created_at", "id",
+              postgresql_where=text("user_id IS NULL"), sqlite_where=text("user_id IS NULL")),
+    )
+
+class AnalysisDetail(Base):
+    """Full analysis text, kept out of the analyses rows that list queries scan."""
+    __tablename__ = "analysis_details"
+    analysis_id = Column(Integer, ForeignKey("analyses.id", ondelete="CASCADE"), primary_key=True)
+    body = Column(CompressedText, nullable=False)
+
+class AnalysisStat(Base):
+    """Per-user analysis counts by month, trend and confidence (see analysis_stats.py)."""
+    __tablename__ = "analysis_stats"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    period = Column(String(7), primary_key=True)  # YYYY-MM
+    trend = Column(String(32), primary_key=True)       # analysis_stats.TRENDS or "unknown"
+    confidence = Column(String(32), primary_key=True)  # high | medium | low | unknown
+    count = Column(Integer, default=0, nullable=False)
+
+class NewsItem(Base):
+    __tablename__ = "news_items"
+    id = Column(Integer, primary_key=True, index=True)
+    url_hash = Column(String(64), unique=True, nullable=False)
+    url = Column(Text, nullable=False)
+    title = Column(Text, nullable=False)
+    source = Column(String)
+    symbols = Column(String, default="")
+    published_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_news_items_published_id", "published_at", "id"),)
+
+class NewsSymbol(Base):
+    """One row per (item, ticker); published_at is copied so symbol pages are index-only."""
+    __tablename__ = "news_symbols"
+    news_id = Column(Integer, ForeignKey("news_items.id", ondelete="CASCADE"), primary_key=True)
+    symbol = Column(String(16), primary_key=True)
+    published_at = Column(DateTime, nullable=False)
+    __table_args__ = (Index("ix_news_symbols_symbol_published", "symbol", "published_at", "news_id"),)
+
+class EmailOutbox(Base):
+    """Transactional email queued in the same commit as the change that triggers it."""
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    html = Column(Text, nullable=False)
+    status = Column(String(16), default="pending", nullable=False)  # pending | sent | dead
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    __table_args__ = (Index("ix_email_outbox_status_next", "status", "next_attempt_at"),)
 
 def get_db():
     db = SessionLocal()
@@ -50,9 +370,21 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def pool_stats() -> dict:
+    return {
+        "config": {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "timeout": DB_POOL_TIMEOUT,
+                   "recycle": DB_POOL_RECYCLE, "pre_ping": DB_POOL_PRE_PING, "workers": WEB_CONCURRENCY},
+        **{name: m.snapshot() for name, m in POOL_METRICS.items()},
+    }
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
-    print("✅ Database tables created!")
+    from migrations import migrate
+    migrate()
+    print("✅ Database schema up to date!")
 
 if __name__ == "__main__":
     init_db()
@@ -0,0 +1,218 @@
+"""
+Transactional email outbox.
+
+Endpoints call enqueue() before their own db.commit(), so the email row is
+committed atomically with the user/token change and the request returns
+without waiting on Resend. A background dispatcher claims due rows in
+batches, sends them concurrently through the shared "resend" client, retries
+failures with exponential backoff and marks rows "dead" once retries are
+exhausted (or Resend rejects the message outright).
+
+Claiming pushes next_attempt_at forward by a lease, so a row whose worker
+died mid-send is picked up again after LEASE_SECONDS. Sends are therefore
+at-least-once.
+
+Bodies carry raw verification / reset links, so html is blanked as soon as a
+row is sent or dead-lettered; only pending rows hold a usable link. Finished
+rows are deleted after RETENTION_DAYS.
+"""
+
+import os
+import random
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from database import SessionLocal, EmailOutbox
+import http_clients
+
+RESEND_API_KEY = os.getenv("RESEND_API_KEY")
+FROM_ADDRESS = "TradeFlow AI <noreply@tradeflowai.cloud>"
+BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "20"))
+CONCURRENCY = int(os.getenv("EMAIL_OUTBOX_CONCURRENCY", "5"))
+MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+POLL_SECONDS = float(os.getenv("EMAIL_OUTBOX_POLL_SECONDS", "5"))
+LEASE_SECONDS = 120
+BACKOFF_BASE = 10
+BACKOFF_MAX = 3600
+RETENTION_DAYS = int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", "7"))
+
+
+class PermanentEmailError(Exception):
+    """Resend rejected the message; retrying will not help."""
+
+
+def enqueue(db, to_email: str, subject: str, html: str) -> EmailOutbox:
+    """Add an email to the caller's transaction; it is sent after commit."""
+    row = EmailOutbox(to_email=to_email, subject=subject, html=html, status="pending",
+                      attempts=0, next_attempt_at=datetime.utcnow())
+    db.add(row)
+    return row
+
+
+def backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim_batch(limit: int = BATCH_SIZE) -> list:
+    """Lease up to limit due rows; returns plain dicts for the senders."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        rows = (db.query(EmailOutbox)
+                .filter(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+                .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all())
+        claimed = []
+        for row in rows:
+            row.attempts += 1
+            row.next_attempt_at = now + timedelta(seconds=LEASE_SECONDS)
+            claimed.append({"id": row.id, "to": row.to_email, "subject": row.subject, "html": row.html, "attempts": row.attempts})
+        db.commit()
+        return claimed
+    finally:
+        db.close()
+
+
+def record_results(results: list):
+    """Apply (id, attempts, error) outcomes in one transaction; error None means sent."""
+    if not results:
+        return
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        rows = {r.id: r for r in db.query(EmailOutbox).filter(EmailOutbox.id.in_([i for i, _, _ in results]))}
+        for email_id, attempts, error in results:
+            row = rows.get(email_id)
+            if row is None:
+                continue
+            if error is None:
+                row.status = "sent"
+                row.sent_at = now
+                row.last_error = None
+                row.html = ""
+            elif isinstance(error, PermanentEmailError) or attempts >= MAX_ATTEMPTS:
+                row.status = "dead"
+                row.last_error = str(error)[:1000]
+                row.html = ""
+                print(f"Email {email_id} dead-lettered after {attempts} attempts: {error}")
+            else:
+                row.next_attempt_at = now + timedelta(seconds=backoff(attempts))
+                row.last_error = str(error)[:1000]
+        db.commit()
+    finally:
+        db.close()
+
+
+def purge_finished(days: int = RETENTION_DAYS) -> int:
+    """Delete sent and dead rows older than days."""
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        deleted = (db.query(EmailOutbox)
+                   .filter(EmailOutbox.status.in_(["sent", "dead"]), func.coalesce(EmailOutbox.sent_at, EmailOutbox.created_at) < cutoff)
+                   .delete(synchronize_session=False))
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+def stats() -> dict:
+    db = SessionLocal()
+    try:
+        counts = dict(db.query(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status).all())
+        oldest = db.query(func.min(EmailOutbox.created_at)).filter(EmailOutbox.status == "pending").scalar()
+    finally:
+        db.close()
+    return {"pending": counts.get("pending", 0), "sent": counts.get("sent", 0), "dead": counts.get("dead", 0),
+            "oldest_pending_seconds": (datetime.utcnow() - oldest).total_seconds() if oldest else 0}
+
+
+async def send_via_resend(email: dict):
+    response = await http_clients.get("resend").post(
+        "/emails",
+        headers={"Authorization": f"Bearer {RESEND_API_KEY}", "Content-Type": "application/json"},
+        json={"from": FROM_ADDRESS, "to": [email["to"]], "subject": email["subject"], "html": email["html"]},
+    )
+    if response.status_code in (200, 201, 202):
+        return
+    if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+        raise PermanentEmailError(f"Resend {response.status_code}: {response.text[:200]}")
+    raise RuntimeError(f"Resend {response.status_code}: {response.text[:200]}")
+
+
+class EmailDispatcher:
+    def __init__(self, send=send_via_resend, concurrency: int = CONCURRENCY, batch_size: int = BATCH_SIZE, poll_seconds: float = POLL_SECONDS):
+        self.send = send
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._wake = asyncio.Event()
+        self._task = None
+        self._loop = None
+        self._last_purge = None
+
+    async def _send_one(self, email: dict):
+        async with self.semaphore:
+            try:
+                await self.send(email)
+                return email["id"], email["attempts"], None
+            except Exception as e:
+                print(f"Email send error ({email['id']}): {e}")
+                return email["id"], email["attempts"], e
+
+    async def drain_once(self) -> int:
+        """Claim, send and record one batch; returns how many were attempted."""
+        batch = await asyncio.to_thread(claim_batch, self.batch_size)
+        if not batch:
+            return 0
+        results = await asyncio.gather(*(self._send_one(e) for e in batch))
+        await asyncio.to_thread(record_results, results)
+        return len(batch)
+
+    async def _run(self):
+        while True:
+            try:
+                while await self.drain_once() == self.batch_size:
+                    pass
+                now = datetime.utcnow()
+                if self._last_purge is None or now - self._last_purge > timedelta(hours=1):
+                    self._last_purge = now
+                    await asyncio.to_thread(purge_finished)
+            except Exception as e:
+                print(f"Email outbox error: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def notify(self):
+        """Wake the dispatcher after a commit that enqueued mail (safe from sync handlers)."""
+        if self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wake.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+dispatcher = EmailDispatcher()
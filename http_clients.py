@@ -0,0 +1,66 @@
+"""
+Named, pooled httpx clients for outbound integrations.
+
+One AsyncClient per integration is opened in the FastAPI lifespan and reused
+by every request, so calls share keep-alive connections (and HTTP/2 when the
+h2 package is installed) instead of paying TCP+TLS setup each time. Each
+client has its own connection limits and timeouts.
+"""
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+CLIENT_CONFIGS = {
+    "resend": {
+        "base_url": "https://api.resend.com",
+        "timeout": httpx.Timeout(10.0, connect=5.0),
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+    },
+    "google": {
+        "timeout": httpx.Timeout(10.0, connect=5.0),
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+    },
+    "news": {
+        "timeout": httpx.Timeout(10.0, connect=5.0),
+        "limits": httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=300),
+        "follow_redirects": True,
+        "headers": {"User-Agent": "Mozilla/5.0"},
+    },
+    "lemonsqueezy": {
+        "base_url": "https://api.lemonsqueezy.com",
+        "timeout": httpx.Timeout(15.0, connect=5.0),
+        "limits": httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=60),
+    },
+}
+
+_clients = {}
+
+
+def _create(name: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(http2=HTTP2_AVAILABLE, **CLIENT_CONFIGS[name])
+
+
+async def start():
+    for name in CLIENT_CONFIGS:
+        if name not in _clients:
+            _clients[name] = _create(name)
+
+
+async def close():
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def get(name: str) -> httpx.AsyncClient:
+    """Pooled client for an integration; created on first use outside the lifespan."""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _create(name)
+    return client
@@ -0,0 +1,159 @@
+"""
+Indicator registry expressed as a dependency graph.
+
+Every node is a function of the OHLCV DataFrame and of the nodes it depends
+on. A request evaluates only the nodes it asks for plus their dependencies,
+and intermediates (EMAs, MACD line, true range...) are computed once per
+DataFrame even when several outputs share them. New indicators only need a
+registration here and, if users can ask for them, an alias.
+"""
+
+import pandas as pd
+
+INDICATORS = {}
+
+# User-facing names (the /analyze-image "indicators" field) -> report nodes
+ALIASES = {
+    "RSI": ["rsi_14"],
+    "MACD": ["macd_signal"],
+    "ATR": ["atr_14"],
+    "EMA": ["ema_20", "ema_200"],
+    "MA": ["ema_20", "ema_200"],
+    "EMA20": ["ema_20"],
+    "EMA200": ["ema_200"],
+    "VOLUME": ["volume_trend"],
+}
+
+# Report nodes in the order they appear under "technical_indicators"
+TECHNICAL = ["rsi_14", "macd_signal", "atr_14", "ema_20", "ema_200"]
+
+
+def indicator(name: str, *deps: str):
+    def register(fn):
+        INDICATORS[name] = (fn, deps)
+        return fn
+    return register
+
+
+class IndicatorContext:
+    """Memoized evaluation of indicator nodes for one DataFrame."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.values = {}
+
+    def get(self, name: str):
+        if name in self.values:
+            return self.values[name]
+        if name not in INDICATORS:
+            raise KeyError(f"Unknown indicator: {name}")
+        fn, deps = INDICATORS[name]
+        value = fn(self.df, *[self.get(d) for d in deps])
+        self.values[name] = value
+        return value
+
+    def evaluate(self, names) -> dict:
+        return {n: self.get(n) for n in names}
+
+
+def resolve(requested) -> list:
+    """Map a comma separated request like "RSI, MACD" to report nodes.
+
+    Returns None when nothing recognisable was asked for, meaning "full set".
+    """
+    if not requested:
+        return None
+    nodes = []
+    for part in str(requested).replace(";", ",").split(","):
+        key = part.strip().upper().replace(" ", "")
+        # Only aliases and scalar report nodes; intermediates are Series.
+        for node in ALIASES.get(key, [key.lower()] if key.lower() in TECHNICAL else []):
+            if node not in nodes:
+                nodes.append(node)
+    return nodes or None
+
+
+# --- price series -----------------------------------------------------------
+
+for _col in ("open", "high", "low", "close", "volume"):
+    indicator(_col)(lambda df, _col=_col: df[_col])
+
+for _span in (12, 20, 26, 200):
+    indicator(f"ema{_span}", "close")(lambda df, close, _span=_span: close.ewm(span=_span).mean())
+
+
+@indicator("true_range", "high", "low", "close")
+def true_range(df, high, low, close):
+    prev_close = close.shift()
+    return pd.concat([
+        high - low,
+        (high - prev_close).abs(),
+        (low - prev_close).abs()
+    ], axis=1).max(axis=1)
+
+
+@indicator("macd_line", "ema12", "ema26")
+def macd_line(df, ema12, ema26):
+    return ema12 - ema26
+
+
+@indicator("macd_signal_line", "macd_line")
+def macd_signal_line(df, macd):
+    return macd.ewm(span=9).mean()
+
+
+# --- report values ----------------------------------------------------------
+
+@indicator("rsi_14", "close")
+def rsi_14(df, close):
+    delta = close.diff()
+    gain = delta.where(delta > 0, 0).rolling(14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
+    rs = gain / loss
+    return round(float((100 - (100 / (1 + rs))).iloc[-1]), 2)
+
+
+@indicator("macd_signal", "macd_line", "macd_signal_line")
+def macd_signal(df, macd, signal):
+    return "Bullish Cross" if float(macd.iloc[-1]) > float(signal.iloc[-1]) else "Bearish Cross"
+
+
+@indicator("atr_14", "true_range")
+def atr_14(df, tr):
+    return round(float(tr.rolling(14).mean().iloc[-1]), 5)
+
+
+@indicator("ema_20", "ema20")
+def ema_20(df, ema):
+    return round(float(ema.iloc[-1]), 5)
+
+
+@indicator("ema_200", "ema200")
+def ema_200(df, ema):
+    return round(float(ema.iloc[-1]), 5)
+
+
+@indicator("current_price", "close")
+def current_price(df, close):
+    return round(float(close.iloc[-1]), 5)
+
+
+@indicator("daily_open_price", "open")
+def daily_open_price(df, open_):
+    return round(float(open_.iloc[0]), 5)
+
+
+@indicator("nearest_support", "low")
+def nearest_support(df, low):
+    return round(float(low.tail(20).min()), 5)
+
+
+@indicator("nearest_resistance", "high")
+def nearest_resistance(df, high):
+    return round(float(high.tail(20).max()), 5)
+
+
+@indicator("volume_trend", "volume")
+def volume_trend(df, volume):
+    vol_avg = float(volume.tail(10).mean())
+    return "Increasing" if float(volume.iloc[-1]) > vol_avg else "Decreasing"
@@ -6,12 +6,13 @@ Backend: FastAPI
 import os
 import hmac
 import hashlib
-import requests
+import http_clients
 from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel
 from typing import Optional
 import json
 from database import get_db, User
+import auth_cache
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 
@@ -39,9 +40,9 @@ class WebhookPayload(BaseModel):
     data: dict
 
 
-def create_checkout_session(variant_id: str, user_email: str, user_id: str) -> dict:
+async def create_checkout_session(variant_id: str, user_email: str, user_id: str) -> dict:
     """Lemon Squeezy checkout session oluştur"""
-    url = "https://api.lemonsqueezy.com/v1/checkouts"
+    url = "/v1/checkouts"
     
     headers = {
         "Accept": "application/vnd.api+json",
@@ -92,7 +93,7 @@ def create_checkout_session(variant_id: str, user_email: str, user_id: str) -> d
         }
     }
     
-    response = requests.post(url, json=payload, headers=headers)
+    response = await http_clients.get("lemonsqueezy").post(url, json=payload, headers=headers)
     
     if response.status_code != 201:
         raise HTTPException(
@@ -129,7 +130,7 @@ async def create_checkout(checkout_req: CheckoutRequest):
         if not variant_id:
             raise HTTPException(status_code=400, detail="Invalid plan")
         
-        checkout_data = create_checkout_session(
+        checkout_data = await create_checkout_session(
             variant_id=variant_id,
             user_email=checkout_req.user_email,
             user_id=checkout_req.user_id
@@ -191,6 +192,7 @@ async def lemon_squeezy_webhook(request: Request, db: Session = Depends(get_db))
                 user.analyses_used = 0  # Reset monthly usage
                 
                 db.commit()
+                auth_cache.invalidate_user(user_email)
                 db.refresh(user)
                 
                 print(f"✅ Database updated: {user_email} -> {plan_type}")
@@ -207,6 +209,7 @@ async def lemon_squeezy_webhook(request: Request, db: Session = Depends(get_db))
             if user:
                 user.subscription_status = status
                 db.commit()
+                auth_cache.invalidate_user(user_email)
                 print(f"🔄 Subscription updated: {user_email} -> {status}")
             else:
                 print(f"❌ User not found: {user_email}")
@@ -219,6 +222,7 @@ async def lemon_squeezy_webhook(request: Request, db: Session = Depends(get_db))
                 user.plan = "free"  # Downgrade to free
                 user.analyses_limit = 3
                 db.commit()
+                auth_cache.invalidate_user(user_email)
                 print(f"❌ Subscription cancelled: {user_email}")
             else:
                 print(f"❌ User not found: {user_email}")
@@ -1,8 +1,9 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import select, func, or_, and_, union_all
 from sqlalchemy.orm import Session
-from database import User, Analysis, SessionLocal, engine, Base
-from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import User, Analysis, AnalysisDetail, SessionLocal, async_engine, get_async_db, pool_stats, read_router
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timedelta
 from google import genai
@@ -10,25 +11,38 @@ from google.genai import types
 from PIL import Image
 import io
 import os
+import asyncio
 import hmac
-import httpx
+from contextlib import asynccontextmanager
 import hashlib
 import json
-import secrets
-import xml.etree.ElementTree as ET
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from market_data import get_market_data
+from market_data import get_market_data, router as market_router
+import auth_cache
+import quota
+from usage_ledger import ledger as usage_ledger
+from passwords import password_hasher
+from rate_limit import rate_limited
+from symbols import registry as symbol_registry
+from news import aggregator as news_aggregator, query_news, parse_cursor
+from price_stream import router as price_stream_router, hub as price_hub
+import http_clients
+import migrations
+import tokens
+import account_deletion
+import analysis_stats
+import email_outbox
+from email_outbox import dispatcher as email_dispatcher
 load_dotenv()
 
-Base.metadata.create_all(bind=engine)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY", "fallback-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 LEMONSQUEEZY_WEBHOOK_SECRET = os.getenv("LEMONSQUEEZY_WEBHOOK_SECRET")
-RESEND_API_KEY = os.getenv("RESEND_API_KEY")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") != "0"
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 GOOGLE_REDIRECT_URI = "https://tradeflow-ai-backend-production.up.railway.app/auth/google/callback"
@@ -46,7 +60,28 @@ PLAN_LIMITS = {
 }
 
 client = genai.Client(api_key=GOOGLE_API_KEY)
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_clients.start()
+    if MIGRATE_ON_STARTUP:
+        await asyncio.to_thread(migrations.migrate)
+    news_aggregator.start()
+    email_dispatcher.start()
+    usage_ledger.start()
+    tokens.sweeper.start()
+    account_deletion.worker.start()
+    yield
+    await account_deletion.worker.stop()
+    await tokens.sweeper.stop()
+    await usage_ledger.stop()
+    await email_dispatcher.stop()
+    await news_aggregator.stop()
+    await price_hub.close()
+    await http_clients.close()
+    await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -54,7 +89,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.include_router(price_stream_router)
 
 def get_db():
     db = SessionLocal()
@@ -63,11 +100,18 @@ def get_db():
     finally:
         db.close()
 
-def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def get_read_db(authorization: str = Header(default="")):
+    """Session for read-only endpoints: a caught-up replica, or the primary
+    for users who wrote within the replica lag window."""
+    try:
+        email = token_email(authorization) if authorization else ""
+    except HTTPException:
+        email = ""  # get_current_user_read rejects the token
+    db = read_router.read_session(prefer_primary=auth_cache.recently_written(email))
+    try:
+        yield db
+    finally:
+        db.close()
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -75,68 +119,108 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def check_and_reset_monthly(user, db):
-    now = datetime.utcnow()
-    last_reset = user.last_reset_at or user.plan_started_at or user.created_at
-    if last_reset and (now - last_reset).days >= 30:
-        user.analyses_used = 0
-        user.last_reset_at = now
-        db.commit()
-
-def get_current_user(authorization: str = Header(...), db: Session = Depends(get_db)):
+def token_email(authorization: str) -> str:
     try:
         token = authorization.replace("Bearer ", "")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
+        email = auth_cache.token_subject(token)
         if not email:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        user = db.query(User).filter(User.email == email).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email = payload.get("sub")
+            if not email:
+                raise HTTPException(status_code=401, detail="Invalid token")
+            auth_cache.remember_token(token, email, payload.get("exp"))
+        return email
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-@app.post("/register")
-async def register(name: str = Form(...), email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == email).first():
+def _load_user(db: Session, email: str, cached: bool = True):
+    if cached:
+        user = auth_cache.get_user(db, email)
+        if user is not None:
+            return user
+    user = db.query(User).filter(User.email == email, User.deleted_at.is_(None)).first()
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    if "replica" not in db.info:
+        # A replica row may lag; caching it would feed write endpoints stale data.
+        auth_cache.put_user(user)
+    return user
+
+def get_current_user(authorization: str = Header(...), db: Session = Depends(get_db)):
+    return _load_user(db, token_email(authorization))
+
+def get_current_user_fresh(authorization: str = Header(...), db: Session = Depends(get_db)):
+    """get_current_user that always reads the row from the primary. For routes
+    that check credentials: the cached snapshot may predate a password change
+    made on another worker."""
+    return _load_user(db, token_email(authorization), cached=False)
+
+def get_current_user_read(authorization: str = Header(...), db: Session = Depends(get_read_db)):
+    """get_current_user bound to the read session (replica when available)."""
+    return _load_user(db, token_email(authorization))
+
+def legacy_analyses_of(user):
+    """Rows written by pre-user_id workers during a rollout; they have no
+    user_id until `python migrations.py --backfill` runs."""
+    return and_(Analysis.user_id.is_(None), Analysis.user_email == user.email)
+
+def analyses_of(user):
+    """Filter for user's analyses, for lookups by id."""
+    return or_(Analysis.user_id == user.id, legacy_analyses_of(user))
+
+async def get_current_user_async(authorization: str = Header(...), db: AsyncSession = Depends(get_async_db)):
+    """get_current_user for async endpoints; the user is bound to the request's AsyncSession."""
+    email = token_email(authorization)
+    user = await auth_cache.get_user_async(db, email)
+    if user is not None:
+        return user
+    user = await db.scalar(select(User).where(User.email == email, User.deleted_at.is_(None)))
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    auth_cache.put_user(user)
+    return user
+
+@app.post("/register", dependencies=[rate_limited("register", form_field="email")])
+async def register(name: str = Form(...), email: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_async_db)):
+    if await db.scalar(select(User.id).where(User.email == email)):
         raise HTTPException(status_code=400, detail="Email already registered")
-    verification_token = secrets.token_urlsafe(32)
-    user = User(name=name, email=email, hashed_password=get_password_hash(password), is_verified=False, verification_token=verification_token)
+    hashed_password = await password_hasher.hash(password)
+    user = User(name=name, email=email, hashed_password=hashed_password, is_verified=False)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.flush()
+    verification_token = tokens.issue(db, user.id, tokens.VERIFY_EMAIL)
     verify_link = f"https://tradeflow-ai-backend-production.up.railway.app/verify-email?token={verification_token}"
     body = f"""<html><body><h2>Verify your email</h2><p>Click below to verify your TradeFlow AI account.</p><a href="{verify_link}" style="background:#f97316;color:white;padding:12px 24px;border-radius:8px;text-decoration:none;font-weight:bold;">Verify Email</a></body></html>"""
-    try:
-        async with httpx.AsyncClient() as c:
-            await c.post(
-                "https://api.resend.com/emails",
-                headers={"Authorization": f"Bearer {RESEND_API_KEY}", "Content-Type": "application/json"},
-                json={"from": "TradeFlow AI <noreply@tradeflowai.cloud>", "to": [email], "subject": "Verify your TradeFlow AI account", "html": body}
-            )
-    except Exception as e:
-        print(f"Verification email error: {e}")
+    email_outbox.enqueue(db, email, "Verify your TradeFlow AI account", body)
+    await db.commit()
+    email_dispatcher.notify()
     return {"message": "Registration successful. Please check your email to verify your account."}
 
-@app.post("/login")
+@app.post("/login", dependencies=[rate_limited("login", form_field="username")])
 def login(username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == username).first()
-    if not user or not verify_password(password, user.hashed_password):
+    user = db.query(User).filter(User.email == username, User.deleted_at.is_(None)).first()
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    ok, new_hash = password_hasher.verify_and_update_sync(password, user.hashed_password)
+    if not ok:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Cost parameters changed since this hash was made; upgrade it in place.
+        user.hashed_password = new_hash
+        db.commit()
+        auth_cache.invalidate_user(user.email)
     if not user.is_verified:
         raise HTTPException(status_code=403, detail="Please verify your email before logging in")
     token = create_access_token({"sub": user.email})
     return {"access_token": token, "token_type": "bearer"}
 
 @app.get("/me")
-def get_me(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    check_and_reset_monthly(current_user, db)
+def get_me(current_user: User = Depends(get_current_user_read)):
     return {
         "email": current_user.email,
         "name": current_user.name,
         "plan": current_user.plan,
-        "analyses_used": current_user.analyses_used,
+        "analyses_used": max(0, quota.effective_used(current_user) + usage_ledger.pending(current_user.id)),
         "analyses_limit": PLAN_LIMITS.get(current_user.plan, 3),
         "subscription_status": current_user.subscription_status,
         "subscription_id": current_user.subscription_id,
@@ -159,12 +243,12 @@ async def analyze_image(
     rr_ratio: str = Form(default="1:2"),
     timeframe: str = Form(default=""),
     language: str = Form(default="en"),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    check_and_reset_monthly(current_user, db)
-    limit = PLAN_LIMITS.get(current_user.plan, 3)
-    if current_user.analyses_used >= limit:
+    email, user_id = current_user.email, current_user.id
+    # Admit against this worker's reserved quota slice; refunded below if the request fails.
+    if not await usage_ledger.admit(current_user, PLAN_LIMITS.get(current_user.plan, 3)):
         raise HTTPException(status_code=403, detail="Monthly analysis limit reached")
     try:
         image_bytes = await file.read()
@@ -451,7 +535,8 @@ Educational analysis only, not financial advice."""
         market_data = get_market_data(
             symbol=symbol if symbol else (asset_type or ""),
             timeframe=timeframe if timeframe else "1h",
-            asset_type=asset_type or ""
+            asset_type=asset_type or "",
+            indicators=indicators
         )
 
         system_instruction = """Sen kurumsal bir Algoritmik Trader ve Smart Money Concepts (SMC) uzmanissin. Goреvin, sana verilen grafik goruntusunu analiz ederek en guvenli alim-satim stratejisini olusturmaktir.
@@ -496,32 +581,101 @@ KESIN KURALLAR:
         lines = analysis_text.split('\n')
         trend_line = lines[0].strip().upper() if len(lines) > 0 else "NEUTRAL"
         confidence_line = lines[1].strip().lower() if len(lines) > 1 else "medium"
+        confidence = analysis_stats.normalize_confidence(confidence_line)
         trend_map = {"UPTREND": "bullish", "DOWNTREND": "bearish", "NEUTRAL": "sideways"}
         trend = trend_map.get(trend_line, "sideways")
 
         record = Analysis(
-            user_email=current_user.email,
+            user_id=user_id,
+            user_email=email,
             trend=trend,
-            confidence=confidence_line,
-            analysis_text=analysis_text
+            confidence=confidence,
+            preview=analysis_text[:200],
+            detail=AnalysisDetail(body=analysis_text),
+            created_at=datetime.utcnow(),
         )
         db.add(record)
-        current_user.analyses_used += 1
-        db.commit()
-        return {"analysis": analysis_text, "trend": trend, "confidence": confidence_line}
+        await analysis_stats.increment_async(db, record)
+        await db.commit()
+        auth_cache.note_write(email)
+        return {"analysis": analysis_text, "trend": trend, "confidence": confidence}
     except HTTPException:
+        usage_ledger.refund(user_id)
         raise
     except Exception as e:
+        usage_ledger.refund(user_id)
         print(f"ERROR: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 @app.get("/analysis-history")
-def get_history(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    analyses = db.query(Analysis).filter(Analysis.user_email == current_user.email).order_by(Analysis.created_at.desc()).limit(50).all()
-    return [{"id": a.id, "trend": a.trend, "confidence": a.confidence, "analysis_text": a.analysis_text[:200], "created_at": a.created_at.isoformat()} for a in analyses]
+def get_history(response: Response, before: str = "", limit: int = 50, current_user: User = Depends(get_current_user_read), db: Session = Depends(get_read_db)):
+    # Only the 200-char preview leaves the database; the cursor for the next
+    # page ("created_at,id" of the last row) is returned in X-Next-Cursor.
+    # Two keyset queries, each walking its own index in order (user_id, and
+    # the partial index of not-yet-backfilled rows), merged under one LIMIT.
+    limit = min(max(limit, 1), 100)
+    preview = func.coalesce(Analysis.preview, func.substr(Analysis.analysis_text, 1, 200)).label("preview")
+    page = []
+    if before:
+        try:
+            ts, analysis_id = parse_cursor(before)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        page.append(or_(Analysis.created_at < ts, and_(Analysis.created_at == ts, Analysis.id < analysis_id)))
+    branches = [
+        select(Analysis.id, Analysis.trend, Analysis.confidence, preview, Analysis.created_at)
+        .where(owner, *page)
+        .order_by(Analysis.created_at.desc(), Analysis.id.desc())
+        .limit(limit)
+        .subquery()
+        for owner in (Analysis.user_id == current_user.id, legacy_analyses_of(current_user))
+    ]
+    merged = union_all(*(select(b) for b in branches)).subquery()
+    analyses = db.execute(select(merged).order_by(merged.c.created_at.desc(), merged.c.id.desc()).limit(limit)).all()
+    if len(analyses) == limit:
+        response.headers["X-Next-Cursor"] = f"{analyses[-1].created_at.isoformat()},{analyses[-1].id}"
+    return [{"id": a.id, "trend": a.trend, "confidence": a.confidence, "analysis_text": a.preview or "", "created_at": a.created_at.isoformat()} for a in analyses]
+
+@app.get("/analysis-stats")
+def get_analysis_stats(current_user: User = Depends(get_current_user_read), db: Session = Depends(get_read_db)):
+    # Served from the analysis_stats rollup; never touches the analyses table.
+    return analysis_stats.summary(db, current_user.id)
+
+@app.get("/analysis/{analysis_id}")
+async def get_analysis(analysis_id: int, current_user: User = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    row = (await db.execute(
+        select(Analysis.id, Analysis.trend, Analysis.confidence, Analysis.created_at, AnalysisDetail.body, Analysis.analysis_text)
+        .outerjoin(AnalysisDetail, AnalysisDetail.analysis_id == Analysis.id)
+        .where(Analysis.id == analysis_id, analyses_of(current_user))
+    )).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return {"id": row.id, "trend": row.trend, "confidence": row.confidence, "analysis_text": row.body if row.body is not None else (row.analysis_text or ""), "created_at": row.created_at.isoformat()}
+
+@app.get("/symbols/search")
+def search_symbols(q: str = "", limit: int = 10):
+    return {"results": [s.to_dict() for s in symbol_registry.search(q, min(max(limit, 1), 50))]}
+
+@app.get("/metrics")
+def get_metrics(x_metrics_token: str = Header(default="")):
+    # Disabled unless METRICS_TOKEN is configured: the payload exposes internals
+    # and some sections run aggregate queries.
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_metrics_token, METRICS_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return {
+        "db_pool": pool_stats(),
+        "replicas": read_router.stats(),
+        "auth_cache": auth_cache.stats(),
+        "market_providers": market_router.stats(),
+        "email_outbox": email_outbox.stats(),
+        "usage_ledger": {**usage_ledger.stats, "accounts": len(usage_ledger.accounts)},
+        "account_deletions": account_deletion.stats(),
+    }
 
 @app.post("/webhook/lemonsqueezy")
-async def lemonsqueezy_webhook(request: Request, db: Session = Depends(get_db)):
+async def lemonsqueezy_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     body = await request.body()
     if LEMONSQUEEZY_WEBHOOK_SECRET:
         signature = request.headers.get("x-signature", "")
@@ -541,7 +695,7 @@ async def lemonsqueezy_webhook(request: Request, db: Session = Depends(get_db)):
     status = attrs.get("status", "")
     if not user_email:
         return {"status": "ignored", "reason": "no email"}
-    user = db.query(User).filter(User.email == user_email).first()
+    user = await db.scalar(select(User).where(User.email == user_email))
     if not user:
         return {"status": "ignored", "reason": "user not found"}
     if event_name in ("subscription_created", "subscription_updated"):
@@ -559,13 +713,15 @@ async def lemonsqueezy_webhook(request: Request, db: Session = Depends(get_db)):
                     user.trial_ends_at = datetime.fromisoformat(trial_ends.replace("Z", "+00:00"))
                 else:
                     user.trial_ends_at = datetime.utcnow() + timedelta(days=7)
-            db.commit()
+            await db.commit()
+            auth_cache.invalidate_user(user.email)
     elif event_name in ("subscription_cancelled", "subscription_expired", "subscription_paused"):
         user.plan = "free"
         user.subscription_status = "inactive"
         user.subscription_id = None
         user.analyses_limit = 3
-        db.commit()
+        await db.commit()
+        auth_cache.invalidate_user(user.email)
     return {"status": "ok"}
 
 @app.post("/debug/upgrade-plan")
@@ -577,68 +733,58 @@ def upgrade_plan(email: str = Form(...), plan: str = Form(...), db: Session = De
     user.analyses_limit = PLAN_LIMITS.get(plan, 3)
     user.subscription_status = "active" if plan != "free" else "inactive"
     db.commit()
+    auth_cache.invalidate_user(user.email)
     return {"message": f"Plan updated to {plan}"}
 
 @app.delete("/analysis/{analysis_id}")
 def delete_analysis(analysis_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    analysis = db.query(Analysis).filter(Analysis.id == analysis_id, Analysis.user_email == current_user.email).first()
+    analysis = db.query(Analysis).filter(Analysis.id == analysis_id, analyses_of(current_user)).first()
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
+    analysis_stats.decrement(db, analysis)
     db.delete(analysis)
     db.commit()
+    auth_cache.note_write(current_user.email)
     return {"message": "Analysis deleted"}
 
 @app.delete("/delete-analysis/{analysis_id}")
 def delete_analysis_alt(analysis_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    analysis = db.query(Analysis).filter(Analysis.id == analysis_id, Analysis.user_email == current_user.email).first()
+    analysis = db.query(Analysis).filter(Analysis.id == analysis_id, analyses_of(current_user)).first()
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
+    analysis_stats.decrement(db, analysis)
     db.delete(analysis)
     db.commit()
+    auth_cache.note_write(current_user.email)
     return {"message": "Analysis deleted"}
 
 class ChangePasswordRequest(BaseModel):
     current_password: str
     new_password: str
 
-@app.post("/change-password")
-def change_password(request: ChangePasswordRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    if not verify_password(request.current_password, current_user.hashed_password):
+@app.post("/change-password", dependencies=[rate_limited("change-password", use_token=True)])
+def change_password(request: ChangePasswordRequest, current_user: User = Depends(get_current_user_fresh), db: Session = Depends(get_db)):
+    if not password_hasher.verify_sync(request.current_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     if len(request.new_password) < 6:
         raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
-    current_user.hashed_password = get_password_hash(request.new_password)
+    current_user.hashed_password = password_hasher.hash_sync(request.new_password)
     db.commit()
+    auth_cache.invalidate_user(current_user.email)
     return {"message": "Password updated successfully"}
 
 @app.get("/news")
-async def get_crypto_news():
+async def get_crypto_news(symbol: str = "", before: str = "", limit: int = 25, db: AsyncSession = Depends(get_async_db)):
+    # The aggregator keeps the store fresh (and fills it on a cold start);
+    # every page, the first included, is read back from the store.
+    warm = await news_aggregator.get() if not before else {}
     try:
-        feeds = [
-            "https://cointelegraph.com/rss",
-            "https://coindesk.com/arc/outboundfeeds/rss/",
-        ]
-        news = []
-        async with httpx.AsyncClient(timeout=10, follow_redirects=True) as c:
-            for feed_url in feeds:
-                try:
-                    response = await c.get(feed_url, headers={"User-Agent": "Mozilla/5.0"})
-                    root = ET.fromstring(response.text)
-                    channel = root.find("channel")
-                    if channel is None:
-                        continue
-                    source_name = channel.findtext("title", "").strip()
-                    for item in channel.findall("item")[:10]:
-                        title = item.findtext("title", "").strip()
-                        url = item.findtext("link", "").strip()
-                        pub_date = item.findtext("pubDate", "").strip()
-                        if title and url:
-                            news.append({"title": title, "url": url, "source": source_name, "published_at": pub_date, "currencies": []})
-                except Exception:
-                    continue
-        return {"news": news[:25]}
-    except Exception as e:
-        return {"news": [], "error": str(e)}
+        page = await db.run_sync(query_news, symbol=symbol, before=before, limit=min(max(limit, 1), 100))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not page["news"] and warm.get("error"):
+        page["error"] = warm["error"]
+    return page
 
 @app.get("/auth/google")
 async def google_login():
@@ -648,70 +794,65 @@ async def google_login():
     return RedirectResponse("https://accounts.google.com/o/oauth2/v2/auth?" + urlencode(params))
 
 @app.get("/auth/google/callback")
-async def google_callback(code: str, db: Session = Depends(get_db)):
+async def google_callback(code: str, db: AsyncSession = Depends(get_async_db)):
     from fastapi.responses import RedirectResponse
     try:
-        async with httpx.AsyncClient() as c:
-            token_response = await c.post("https://oauth2.googleapis.com/token", data={"code": code, "client_id": GOOGLE_CLIENT_ID, "client_secret": GOOGLE_CLIENT_SECRET, "redirect_uri": GOOGLE_REDIRECT_URI, "grant_type": "authorization_code"})
-            token_data = token_response.json()
-            access_token = token_data.get("access_token")
-            if not access_token:
-                return RedirectResponse(f"{FRONTEND_URL}/login?error=google_failed")
-            user_response = await c.get("https://www.googleapis.com/oauth2/v2/userinfo", headers={"Authorization": f"Bearer {access_token}"})
-            user_info = user_response.json()
-            email = user_info.get("email")
-            name = user_info.get("name", email)
-            if not email:
-                return RedirectResponse(f"{FRONTEND_URL}/login?error=no_email")
-            user = db.query(User).filter(User.email == email).first()
-            if not user:
-                user = User(name=name, email=email, hashed_password=get_password_hash(os.urandom(32).hex()), plan="free", analyses_used=0, analyses_limit=3)
-                db.add(user)
-                db.commit()
-                db.refresh(user)
-            jwt_token = create_access_token({"sub": user.email})
-            return RedirectResponse(f"{FRONTEND_URL}/auth/callback?token={jwt_token}")
+        c = http_clients.get("google")
+        token_response = await c.post("https://oauth2.googleapis.com/token", data={"code": code, "client_id": GOOGLE_CLIENT_ID, "client_secret": GOOGLE_CLIENT_SECRET, "redirect_uri": GOOGLE_REDIRECT_URI, "grant_type": "authorization_code"})
+        token_data = token_response.json()
+        access_token = token_data.get("access_token")
+        if not access_token:
+            return RedirectResponse(f"{FRONTEND_URL}/login?error=google_failed")
+        user_response = await c.get("https://www.googleapis.com/oauth2/v2/userinfo", headers={"Authorization": f"Bearer {access_token}"})
+        user_info = user_response.json()
+        email = user_info.get("email")
+        name = user_info.get("name", email)
+        if not email:
+            return RedirectResponse(f"{FRONTEND_URL}/login?error=no_email")
+        user = await db.scalar(select(User).where(User.email == email))
+        if not user:
+            # OAuth-only account: no password hash until the user sets one via reset.
+            user = User(name=name, email=email, hashed_password=None, plan="free", analyses_used=0, analyses_limit=3)
+            db.add(user)
+            await db.commit()
+        jwt_token = create_access_token({"sub": user.email})
+        return RedirectResponse(f"{FRONTEND_URL}/auth/callback?token={jwt_token}")
     except Exception as e:
         from fastapi.responses import RedirectResponse
         return RedirectResponse(f"{FRONTEND_URL}/login?error={str(e)}")
 
 @app.post("/update-profile")
-async def update_profile(request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_profile(request: Request, current_user: User = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     data = await request.json()
     name = data.get("name", "").strip()
     if not name:
         raise HTTPException(status_code=400, detail="Name cannot be empty")
     current_user.name = name
-    db.commit()
+    await db.commit()
+    auth_cache.invalidate_user(current_user.email)
     return {"message": "Profile updated successfully"}
 
 @app.delete("/delete-account")
-async def delete_account(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db.query(Analysis).filter(Analysis.user_email == current_user.email).delete()
-    db.delete(current_user)
-    db.commit()
+async def delete_account(current_user: User = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    # Only mark the account here; analyses are purged in chunks in the background.
+    email = current_user.email
+    await account_deletion.request_deletion(db, current_user)
+    await db.commit()
+    auth_cache.invalidate_user(email)
+    account_deletion.worker.notify()
     return {"message": "Account deleted successfully"}
 
-@app.post("/forgot-password")
-async def forgot_password(email: str = Form(...), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == email).first()
+@app.post("/forgot-password", dependencies=[rate_limited("forgot-password", form_field="email")])
+async def forgot_password(email: str = Form(...), db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == email, User.deleted_at.is_(None)))
     if not user:
         return {"message": "If this email exists, a reset link has been sent"}
-    token = secrets.token_urlsafe(32)
-    user.reset_token = token
-    user.reset_token_expires = datetime.utcnow() + timedelta(hours=1)
-    db.commit()
+    token = tokens.issue(db, user.id, tokens.RESET_PASSWORD)
     reset_link = f"https://www.tradeflowai.cloud/reset-password?token={token}"
     body = f"""<html><body><h2>Password Reset</h2><p>Click below to reset your password. Expires in 1 hour.</p><a href="{reset_link}" style="background:#f97316;color:white;padding:12px 24px;border-radius:8px;text-decoration:none;font-weight:bold;">Reset Password</a><p>If you did not request this, ignore this email.</p></body></html>"""
-    try:
-        async with httpx.AsyncClient() as c:
-            res = await c.post("https://api.resend.com/emails", headers={"Authorization": f"Bearer {RESEND_API_KEY}", "Content-Type": "application/json"}, json={"from": "TradeFlow AI <noreply@tradeflowai.cloud>", "to": [email], "subject": "TradeFlow AI - Password Reset", "html": body})
-            if res.status_code != 200:
-                raise HTTPException(status_code=500, detail="Failed to send email")
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Failed to send email")
+    email_outbox.enqueue(db, email, "TradeFlow AI - Password Reset", body)
+    await db.commit()
+    email_dispatcher.notify()
     return {"message": "If this email exists, a reset link has been sent"}
 
 class ResetPasswordRequest(BaseModel):
@@ -719,40 +860,29 @@ class ResetPasswordRequest(BaseModel):
     new_password: str
 
 @app.post("/reset-password")
-async def reset_password(data: ResetPasswordRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.reset_token == data.token).first()
-    if not user or not user.reset_token_expires or user.reset_token_expires < datetime.utcnow():
+async def reset_password(data: ResetPasswordRequest, db: AsyncSession = Depends(get_async_db)):
+    # The token delete only commits on success, so a rejected password keeps the link usable.
+    user_id = await tokens.consume_async(db, data.token, tokens.RESET_PASSWORD)
+    user = await db.get(User, user_id) if user_id else None
+    if not user:
         raise HTTPException(status_code=400, detail="Invalid or expired token")
     if len(data.new_password) < 6:
         raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
-    user.hashed_password = get_password_hash(data.new_password)
-    user.reset_token = None
-    user.reset_token_expires = None
-    db.commit()
+    user.hashed_password = await password_hasher.hash(data.new_password)
+    await tokens.revoke_async(db, user.id, tokens.RESET_PASSWORD)
+    await db.commit()
+    auth_cache.invalidate_user(user.email)
     return {"message": "Password reset successfully"}
 
 @app.get("/verify-email")
 def verify_email(token: str, db: Session = Depends(get_db)):
     from fastapi.responses import RedirectResponse
-    user = db.query(User).filter(User.verification_token == token).first()
+    user_id = tokens.consume(db, token, tokens.VERIFY_EMAIL)
+    user = db.get(User, user_id) if user_id else None
     if not user:
         raise HTTPException(status_code=400, detail="Invalid verification token")
     user.is_verified = True
-    user.verification_token = None
     db.commit()
+    auth_cache.invalidate_user(user.email)
     jwt_token = create_access_token({"sub": user.email})
     return RedirectResponse(url=f"https://www.tradeflowai.cloud/auth/callback?token={jwt_token}")
-
-@app.on_event("startup")
-async def migrate_db():
-    from sqlalchemy import text
-    with engine.connect() as conn:
-        try:
-            conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS reset_token VARCHAR"))
-            conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS reset_token_expires TIMESTAMP"))
-            conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_verified BOOLEAN DEFAULT FALSE"))
-            conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS verification_token VARCHAR"))
-            conn.commit()
-            print("✅ Migration done")
-        except Exception as e:
-            print(f"Migration skipped: {e}")
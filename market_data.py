@@ -1,6 +1,10 @@
 import yfinance as yf
 import pandas as pd
 from datetime import datetime
+import ohlcv_cache
+import symbols
+from market_providers import Provider, ProviderRouter
+from indicators import IndicatorContext, TECHNICAL, resolve as resolve_indicators
 
 try:
     import ccxt
@@ -9,154 +13,181 @@ except:
     CCXT_AVAILABLE = False
 
 def detect_asset_type(symbol: str) -> str:
+    return symbols.classify(symbol)
+
+PERIOD_DAYS = {"1d": 1, "5d": 5, "1mo": 30, "3mo": 90, "6mo": 182, "2y": 730}
+
+def _cached_ohlcv(cache_symbol: str, interval: str, fetch) -> pd.DataFrame:
+    """Serve bars from the disk cache, topping it up via fetch(since) when stale.
+
+    fetch receives the last cached bar time (or None for a full download) and
+    returns a DataFrame with lowercase OHLCV columns and a datetime index.
+    """
+    cached = ohlcv_cache.load(cache_symbol, interval)
+    has_cache = cached is not None and not cached.empty
+    if has_cache and ohlcv_cache.is_fresh(cache_symbol, interval):
+        return cached
+    since = cached.index[-1] if has_cache else None
+    try:
+        fresh = fetch(since)
+    except Exception as e:
+        if not has_cache:
+            raise
+        print(f"OHLCV refresh failed for {cache_symbol}, serving cached bars: {e}")
+        return cached
+    if fresh is None or fresh.empty:
+        ohlcv_cache.mark_fetched(cache_symbol, interval)
+        return cached if has_cache else pd.DataFrame()
+    try:
+        ohlcv_cache.append(cache_symbol, interval, fresh)
+        df = ohlcv_cache.load(cache_symbol, interval)
+        if df is not None:
+            return df
+    except Exception as e:
+        print(f"OHLCV cache write error: {e}")
+    return fresh
+
+_exchange = None
+
+def _get_exchange():
+    # One client per process so markets are loaded once, not on every call.
+    global _exchange
+    if _exchange is None:
+        _exchange = ccxt.binance()
+    return _exchange
+
+def crypto_pair(symbol: str) -> str:
+    """BTCUSDT -> BTC/USDT (ccxt unified symbol)."""
+    pair = symbols.ccxt_pair(symbol)
+    if pair:
+        return pair
     symbol = symbol.upper().strip()
-    crypto_keywords = ["USDT","USDC","BTC","ETH","BNB","SOL","XRP","DOGE","ADA","DOT","MATIC","PEPE","SHIB","AVAX"]
-    commodity_keywords = ["XAUUSD","XAGUSD","GC=F","SI=F","CL=F"]
-    forex_keywords = ["USD","EUR","GBP","JPY","CHF","AUD","CAD","NZD"]
-    
-    if any(k in symbol for k in commodity_keywords) or symbol in ["XAUUSD","XAGUSD"]:
-        return "commodity"
-    for k in crypto_keywords:
-        if symbol.endswith(k) or symbol.startswith(k):
-            return "crypto"
-    if any(k in symbol for k in forex_keywords) and len(symbol) == 6:
-        return "forex"
-    return "stock"
-
-def get_crypto_data(symbol: str, timeframe: str = "1h") -> dict:
+    if "/" in symbol:
+        return symbol
+    if symbol.endswith("USDT"):
+        return symbol[:-4] + "/USDT"
+    if symbol.endswith("BTC"):
+        return symbol[:-3] + "/BTC"
+    return symbol + "/USDT"
+
+def get_crypto_data(symbol: str, timeframe: str = "1h", indicators: str = "") -> dict:
     if not CCXT_AVAILABLE:
         return {}
     try:
-        exchange = ccxt.binance()
-        pair = symbol
-        if "/" not in symbol:
-            if symbol.endswith("USDT"):
-                pair = symbol[:-4] + "/USDT"
-            elif symbol.endswith("BTC"):
-                pair = symbol[:-3] + "/BTC"
-            else:
-                pair = symbol + "/USDT"
+        exchange = _get_exchange()
+        pair = crypto_pair(symbol)
         
-        ohlcv = exchange.fetch_ohlcv(pair, timeframe, limit=200)
-        df = pd.DataFrame(ohlcv, columns=["timestamp","open","high","low","close","volume"])
-        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-        df.set_index("timestamp", inplace=True)
-        return calculate_indicators(df, symbol)
+        bar_ms = exchange.parse_timeframe(timeframe) * 1000
+
+        def fetch(since):
+            since_ms = int(since.value // 1_000_000) if since is not None else None
+            # An incremental fetch only reaches "now" if the gap fits in one page.
+            if since_ms is not None and since_ms < exchange.milliseconds() - 200 * bar_ms:
+                since_ms = None
+            ohlcv = exchange.fetch_ohlcv(pair, timeframe, since=since_ms, limit=200)
+            df = pd.DataFrame(ohlcv, columns=["timestamp","open","high","low","close","volume"])
+            df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms", utc=True)
+            df.set_index("timestamp", inplace=True)
+            return df
+
+        df = _cached_ohlcv(pair, timeframe, fetch)
+        if df.empty:
+            return {}
+        return calculate_indicators(df.tail(200), symbol, indicators)
     except Exception as e:
         print(f"Crypto data error: {e}")
         return {}
 
-def get_yfinance_data(symbol: str, timeframe: str = "1h") -> dict:
+def get_yfinance_data(symbol: str, timeframe: str = "1h", indicators: str = "") -> dict:
     try:
         tf_map = {"1m":"1m","5m":"5m","15m":"15m","30m":"30m","1h":"1h","4h":"1h","1d":"1d","1w":"1wk","daily":"1d","weekly":"1wk"}
         period_map = {"1m":"1d","5m":"5d","15m":"5d","30m":"5d","1h":"1mo","4h":"3mo","1d":"6mo","1w":"2y","daily":"6mo","weekly":"2y"}
         
-        yf_symbol = symbol.upper()
-        symbol_map = {
-            "BTCUSDT":"BTC-USD","ETHUSDT":"ETH-USD","SOLUSDT":"SOL-USD",
-            "BNBUSDT":"BNB-USD","XRPUSDT":"XRP-USD","DOGEUSDT":"DOGE-USD",
-            "ADAUSDT":"ADA-USD","DOTUSDT":"DOT-USD","MATICUSDT":"MATIC-USD",
-            "PEPEUSDT":"PEPE-USD","SHIBUSDT":"SHIB-USD","AVAXUSDT":"AVAX-USD",
-            "XAUUSD":"GC=F","GOLD":"GC=F","XAGUSD":"SI=F",
-            "EURUSD":"EURUSD=X","GBPUSD":"GBPUSD=X","USDJPY":"USDJPY=X",
-            "AUDUSD":"AUDUSD=X","USDCAD":"USDCAD=X","USDCHF":"USDCHF=X",
-            "NZDUSD":"NZDUSD=X","GBPJPY":"GBPJPY=X","EURJPY":"EURJPY=X","USDTRY":"USDTRY=X",
-            "NASDAQ":"QQQ","SP500":"SPY","DOW":"DIA",
-        }
-        yf_symbol = symbol_map.get(yf_symbol, yf_symbol)
+        yf_symbol = symbols.yfinance_ticker(symbol)
         
         tf_key = timeframe.lower()
         yf_tf = tf_map.get(tf_key, "1h")
         yf_period = period_map.get(tf_key, "1mo")
         
         ticker = yf.Ticker(yf_symbol)
-        df = ticker.history(period=yf_period, interval=yf_tf)
+        window_start = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=PERIOD_DAYS.get(yf_period, 30))
+
+        def fetch(since):
+            if since is not None and since > window_start:
+                df = ticker.history(start=since.to_pydatetime(), interval=yf_tf)
+            else:
+                df = ticker.history(period=yf_period, interval=yf_tf)
+            df.columns = [c.lower() for c in df.columns]
+            return df
+
+        # The period is part of the key so "1h" and "4h" (both 1h bars) keep their own depth.
+        df = _cached_ohlcv(yf_symbol, f"{yf_tf}-{yf_period}", fetch)
+        df = df.iloc[df.index.searchsorted(window_start):] if not df.empty else df
         
         if df.empty:
             return {}
         
-        df.columns = [c.lower() for c in df.columns]
-        return calculate_indicators(df, symbol)
+        return calculate_indicators(df, symbol, indicators)
     except Exception as e:
         print(f"YFinance error: {e}")
         return {}
 
-def calculate_indicators(df: pd.DataFrame, symbol: str) -> dict:
+def calculate_indicators(df: pd.DataFrame, symbol: str, indicators: str = "") -> dict:
     try:
-        close = df["close"]
-        high = df["high"]
-        low = df["low"]
-        volume = df["volume"]
-        
-        # RSI
-        delta = close.diff()
-        gain = delta.where(delta > 0, 0).rolling(14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-        rs = gain / loss
-        rsi = round(float((100 - (100 / (1 + rs))).iloc[-1]), 2)
+        requested = resolve_indicators(indicators)
+        technical = requested if requested is not None else TECHNICAL
+        ctx = IndicatorContext(df)
+        v = ctx.evaluate(["current_price", "daily_open_price", "nearest_support", "nearest_resistance", "volume_trend"] + technical)
+        current_price = v["current_price"]
+        ema20 = v.get("ema_20")
+        ema200 = v.get("ema_200")
         
-        # EMA
-        ema20 = round(float(close.ewm(span=20).mean().iloc[-1]), 5)
-        ema200 = round(float(close.ewm(span=200).mean().iloc[-1]), 5)
+        trend_context = {}
+        sentiment = {"volume_trend": v["volume_trend"]}
+        if ema20 is not None:
+            trend_context["short_term_trend"] = "Bullish" if current_price > ema20 else "Bearish"
+            sentiment["price_vs_ema20"] = "Above" if current_price > ema20 else "Below"
+        if ema200 is not None:
+            trend_context["long_term_trend"] = "Bullish" if current_price > ema200 else "Bearish"
+            sentiment["price_vs_ema200"] = "Above" if current_price > ema200 else "Below"
         
-        # MACD
-        ema12 = close.ewm(span=12).mean()
-        ema26 = close.ewm(span=26).mean()
-        macd_line = ema12 - ema26
-        signal_line = macd_line.ewm(span=9).mean()
-        macd_text = "Bullish Cross" if float(macd_line.iloc[-1]) > float(signal_line.iloc[-1]) else "Bearish Cross"
-        
-        # ATR
-        tr = pd.concat([
-            high - low,
-            (high - close.shift()).abs(),
-            (low - close.shift()).abs()
-        ], axis=1).max(axis=1)
-        atr = round(float(tr.rolling(14).mean().iloc[-1]), 5)
-        
-        current_price = round(float(close.iloc[-1]), 5)
-        daily_open = round(float(df["open"].iloc[0]), 5)
-        support = round(float(low.tail(20).min()), 5)
-        resistance = round(float(high.tail(20).max()), 5)
-        vol_avg = float(volume.tail(10).mean())
-        volume_trend = "Increasing" if float(volume.iloc[-1]) > vol_avg else "Decreasing"
-        
-        return {
+        result = {
             "asset_info": {
                 "symbol": symbol.upper(),
                 "current_price": current_price,
-                "daily_open_price": daily_open
-            },
-            "multi_timeframe_context": {
-                "short_term_trend": "Bullish" if current_price > ema20 else "Bearish",
-                "long_term_trend": "Bullish" if current_price > ema200 else "Bearish"
-            },
-            "technical_indicators": {
-                "rsi_14": rsi,
-                "macd_signal": macd_text,
-                "atr_14": atr,
-                "ema_20": ema20,
-                "ema_200": ema200
-            },
-            "market_sentiment": {
-                "volume_trend": volume_trend,
-                "price_vs_ema20": "Above" if current_price > ema20 else "Below",
-                "price_vs_ema200": "Above" if current_price > ema200 else "Below"
+                "daily_open_price": v["daily_open_price"]
             },
+            "multi_timeframe_context": trend_context,
+            "technical_indicators": {name: v[name] for name in technical},
+            "market_sentiment": sentiment,
             "key_liquidity_levels": {
-                "nearest_support": support,
-                "nearest_resistance": resistance
+                "nearest_support": v["nearest_support"],
+                "nearest_resistance": v["nearest_resistance"]
             }
         }
+        if not trend_context:
+            del result["multi_timeframe_context"]
+        return result
     except Exception as e:
         print(f"Indicator calc error: {e}")
         return {}
 
-def get_market_data(symbol: str, timeframe: str = "1h", asset_type: str = "") -> dict:
+router = ProviderRouter(
+    providers={
+        "ccxt": Provider("ccxt", get_crypto_data, available=CCXT_AVAILABLE),
+        "yfinance": Provider("yfinance", get_yfinance_data),
+    },
+    routes={
+        "crypto": ["ccxt", "yfinance"],
+        "default": ["yfinance"],
+    },
+)
+
+def get_market_data(symbol: str, timeframe: str = "1h", asset_type: str = "", indicators: str = "") -> dict:
     if not symbol:
         return {}
     try:
-        return get_yfinance_data(symbol, timeframe)
+        return router.fetch(symbol, timeframe, detect_asset_type(symbol), indicators)
     except Exception as e:
         print(f"Market data error: {e}")
         return {}
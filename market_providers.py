@@ -0,0 +1,128 @@
+"""
+Market data provider routing with latency tracking and hedged requests.
+
+Each provider wraps a blocking fetch function returning the indicator dict
+used by the analysis prompt ({} means "no data"). The router orders providers
+per asset type, and if the primary has not answered within its own p90
+latency it fires the same request at the secondary and takes whichever
+non-empty answer arrives first.
+"""
+
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 10
+DEFAULT_HEDGE_AFTER = 1.5
+MAX_ERROR_RATE = 0.5
+REQUEST_TIMEOUT = 15.0
+
+
+class Provider:
+    def __init__(self, name: str, fetch, available: bool = True):
+        self.name = name
+        self.fetch = fetch
+        self.available = available
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._outcomes = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def call(self, symbol: str, timeframe: str, indicators: str = "") -> dict:
+        start = time.perf_counter()
+        result = {}
+        try:
+            result = self.fetch(symbol, timeframe, indicators) or {}
+        except Exception as e:
+            print(f"{self.name} provider error: {e}")
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+            self._outcomes.append(bool(result))
+        return result
+
+    def p90_latency(self):
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[int(0.9 * (len(samples) - 1))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            outcomes = list(self._outcomes)
+        if not outcomes:
+            return 0.0
+        return 1 - sum(outcomes) / len(outcomes)
+
+    def stats(self) -> dict:
+        p90 = self.p90_latency()
+        return {
+            "available": self.available,
+            "calls": len(self._outcomes),
+            "error_rate": round(self.error_rate(), 3),
+            "p90_latency_ms": round(p90 * 1000, 1) if p90 is not None else None,
+        }
+
+
+class StubProvider(Provider):
+    """Offline provider with a fixed answer, delay and failure mode (for tests)."""
+
+    def __init__(self, name: str, result: dict = None, delay: float = 0.0, fail: bool = False):
+        def fetch(symbol, timeframe, indicators=""):
+            time.sleep(delay)
+            if fail:
+                raise RuntimeError(f"{name} stub failure")
+            return dict(result or {"asset_info": {"symbol": symbol.upper(), "provider": name}})
+        super().__init__(name, fetch)
+
+
+class ProviderRouter:
+    def __init__(self, providers: dict, routes: dict, max_workers: int = 8):
+        """routes maps an asset type (or "default") to provider names in preference order."""
+        self.providers = providers
+        self.routes = routes
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="market-data")
+
+    def candidates(self, asset_type: str) -> list:
+        names = self.routes.get(asset_type, self.routes.get("default", []))
+        chain = [self.providers[n] for n in names if n in self.providers and self.providers[n].available]
+        # A primary that keeps failing is demoted behind the healthy secondary.
+        if len(chain) > 1 and chain[0].error_rate() > MAX_ERROR_RATE and chain[1].error_rate() <= MAX_ERROR_RATE:
+            chain[0], chain[1] = chain[1], chain[0]
+        return chain
+
+    def fetch(self, symbol: str, timeframe: str, asset_type: str, indicators: str = "") -> dict:
+        chain = self.candidates(asset_type)
+        if not chain:
+            return {}
+        primary = chain[0]
+        pending = {self._pool.submit(primary.call, symbol, timeframe, indicators): primary}
+        if len(chain) == 1:
+            return next(iter(pending)).result(timeout=REQUEST_TIMEOUT)
+
+        hedge_after = primary.p90_latency() or DEFAULT_HEDGE_AFTER
+        done, _ = wait(pending, timeout=hedge_after)
+        for f in done:
+            result = f.result()
+            if result:
+                return result
+            pending.pop(f)
+        secondary = chain[1]
+        print(f"Hedging {symbol} {timeframe}: {primary.name} -> {secondary.name}")
+        pending[self._pool.submit(secondary.call, symbol, timeframe, indicators)] = secondary
+
+        deadline = time.monotonic() + REQUEST_TIMEOUT
+        while pending:
+            done, _ = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for f in done:
+                pending.pop(f)
+                result = f.result()
+                if result:
+                    return result
+        return {}
+
+    def stats(self) -> dict:
+        return {name: p.stats() for name, p in self.providers.items()}
@@ -0,0 +1,437 @@
+"""
+Versioned schema migrations.
+
+Each migration runs once, in its own transaction, and is recorded in the
+schema_version table. At startup a worker issues one SELECT against
+schema_version. When it is already at LATEST it runs no DDL at all.
+Otherwise it takes a Postgres advisory lock, so concurrent workers apply
+pending migrations exactly once.
+
+To change the schema, append a migration with the next version number. Never
+change what one that has shipped does: steps spell out their DDL (or use the
+frozen table definitions below) and never read the live models, so a version
+means the same schema however database.py evolves. Steps must tolerate
+pre-existing objects, because databases created before this runner existed
+are brought in at version 1.
+
+    python migrations.py              # apply pending migrations
+    python migrations.py --status     # show current / latest version
+    python migrations.py --backfill   # rerun the analyses.user_id backfill (and stats)
+"""
+
+import sys
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import (
+    text, inspect, select, bindparam, MetaData, Table, Column, Index, ForeignKey,
+    Integer, String, Text, DateTime, Boolean, LargeBinary,
+)
+from database import engine
+from tokens import hash_token
+import analysis_stats
+
+LOCK_KEY = 712_204_045  # arbitrary, constant across deploys
+BACKFILL_BATCH = 1000
+
+MIGRATIONS = []
+
+# Tables as each migration created them. Frozen: add a new migration instead
+# of editing these.
+SCHEMA = MetaData()
+
+_users_v1 = Table(
+    "users", SCHEMA,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("email", String, unique=True, index=True),
+    Column("hashed_password", String),
+    Column("name", String),
+    Column("plan", String),
+    Column("analyses_used", Integer),
+    Column("analyses_limit", Integer),
+    Column("analyses_reserved", Integer),
+    Column("reserved_until", DateTime),
+    Column("subscription_status", String),
+    Column("subscription_id", String),
+    Column("plan_started_at", DateTime),
+    Column("plan_ends_at", DateTime),
+    Column("last_reset_at", DateTime),
+    Column("is_verified", Boolean),
+    Column("verification_token", String),
+    Column("reset_token", String),
+    Column("reset_token_expires", DateTime),
+    Column("created_at", DateTime),
+)
+
+_analyses_v1 = Table(
+    "analyses", SCHEMA,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_email", String, ForeignKey("users.email")),
+    Column("trend", String),
+    Column("confidence", String),
+    Column("preview", String(200)),
+    Column("analysis_text", Text),
+    Column("created_at", DateTime),
+    Index("ix_analyses_user_created", "user_email", "created_at", "id"),
+)
+
+_analysis_details_v1 = Table(
+    "analysis_details", SCHEMA,
+    Column("analysis_id", Integer, ForeignKey("analyses.id", ondelete="CASCADE"), primary_key=True),
+    Column("body", LargeBinary, nullable=False),  # zlib-compressed text
+)
+
+_news_items_v1 = Table(
+    "news_items", SCHEMA,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("url_hash", String(64), unique=True, nullable=False),
+    Column("url", Text, nullable=False),
+    Column("title", Text, nullable=False),
+    Column("source", String),
+    Column("symbols", String),
+    Column("published_at", DateTime, nullable=False),
+    Column("created_at", DateTime),
+    Index("ix_news_items_published_id", "published_at", "id"),
+)
+
+_news_symbols_v1 = Table(
+    "news_symbols", SCHEMA,
+    Column("news_id", Integer, ForeignKey("news_items.id", ondelete="CASCADE"), primary_key=True),
+    Column("symbol", String(16), primary_key=True),
+    Column("published_at", DateTime, nullable=False),
+    Index("ix_news_symbols_symbol_published", "symbol", "published_at", "news_id"),
+)
+
+_email_outbox_v1 = Table(
+    "email_outbox", SCHEMA,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("to_email", String, nullable=False),
+    Column("subject", String, nullable=False),
+    Column("html", Text, nullable=False),
+    Column("status", String(16), nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("next_attempt_at", DateTime, nullable=False),
+    Column("last_error", Text),
+    Column("created_at", DateTime),
+    Column("sent_at", DateTime),
+    Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+)
+
+BASELINE_TABLES = [_users_v1, _analyses_v1, _analysis_details_v1, _news_items_v1, _news_symbols_v1, _email_outbox_v1]
+
+_auth_tokens_v5 = Table(
+    "auth_tokens", SCHEMA,
+    Column("id", Integer, primary_key=True),
+    Column("token_hash", String(64), unique=True, nullable=False),
+    Column("purpose", String(32), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+    Column("created_at", DateTime),
+    Index("ix_auth_tokens_expires", "expires_at"),
+    Index("ix_auth_tokens_user_purpose", "user_id", "purpose"),
+)
+
+_account_deletions_v8 = Table(
+    "account_deletions", SCHEMA,
+    Column("user_id", Integer, primary_key=True),
+    Column("email", String, nullable=False),
+    Column("status", String(16), nullable=False),
+    Column("analyses_deleted", Integer, nullable=False),
+    Column("requested_at", DateTime),
+    Column("updated_at", DateTime),
+    Column("completed_at", DateTime),
+    Index("ix_account_deletions_status", "status"),
+)
+
+_account_deletions_v12 = Table(
+    "account_deletions", MetaData(),
+    Column("user_id", Integer, primary_key=True),
+    Column("email", String),
+    Column("status", String(16), nullable=False),
+    Column("analyses_deleted", Integer, nullable=False),
+    Column("requested_at", DateTime),
+    Column("updated_at", DateTime),
+    Column("completed_at", DateTime),
+    Index("ix_account_deletions_status", "status"),
+)
+
+_analysis_stats_v9 = Table(
+    "analysis_stats", SCHEMA,
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+    Column("period", String(7), primary_key=True),
+    Column("trend", String(32), primary_key=True),
+    Column("confidence", String(32), primary_key=True),
+    Column("count", Integer, nullable=False),
+)
+
+
+def migration(version: int, name: str, transactional: bool = True):
+    """transactional=False steps manage their own commits (chunked backfills) and must be resumable."""
+    def register(fn):
+        MIGRATIONS.append((version, name, fn, transactional))
+        return fn
+    return register
+
+
+def add_column(conn, table: str, column: str, ddl: str):
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def online_ddl(conn, statement: str):
+    """Run index DDL outside a transaction; {concurrently} becomes CONCURRENTLY
+    on Postgres, so building or dropping an index never blocks writes."""
+    concurrently = "CONCURRENTLY " if conn.dialect.name == "postgresql" else ""
+    conn.commit()
+    conn.execution_options(isolation_level="AUTOCOMMIT")  # CONCURRENTLY cannot run in a transaction
+    try:
+        conn.execute(text(statement.format(concurrently=concurrently)))
+    finally:
+        conn.commit()
+        conn.execution_options(isolation_level=conn.default_isolation_level)
+
+
+@migration(1, "create tables")
+def _create_tables(conn):
+    # The schema main.py's create_all produced when this runner was introduced.
+    SCHEMA.create_all(conn, tables=BASELINE_TABLES, checkfirst=True)
+
+
+@migration(2, "users auth and plan columns")
+def _users_auth_columns(conn):
+    # Previously the startup ALTERs in main.py and add_columns.py.
+    add_column(conn, "users", "plan_started_at", "TIMESTAMP")
+    add_column(conn, "users", "plan_ends_at", "TIMESTAMP")
+    add_column(conn, "users", "analyses_limit", "INTEGER DEFAULT 3")
+    add_column(conn, "users", "reset_token", "VARCHAR")
+    add_column(conn, "users", "reset_token_expires", "TIMESTAMP")
+    add_column(conn, "users", "is_verified", "BOOLEAN DEFAULT FALSE")
+    add_column(conn, "users", "verification_token", "VARCHAR")
+    conn.execute(text("UPDATE users SET analyses_limit = 3 WHERE analyses_limit IS NULL"))
+
+
+@migration(3, "analysis history index and preview")
+def _analysis_history(conn):
+    add_column(conn, "analyses", "preview", "VARCHAR(200)")
+    # Shipped as index.create() from the Analysis model; this is the same DDL,
+    # spelled out so later model edits cannot change what version 3 means.
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_analyses_user_created ON analyses (user_email, created_at, id)"))
+
+
+@migration(4, "quota reservation columns")
+def _quota_reservations(conn):
+    add_column(conn, "users", "analyses_reserved", "INTEGER DEFAULT 0")
+    add_column(conn, "users", "reserved_until", "TIMESTAMP")
+
+
+@migration(5, "hashed auth tokens")
+def _auth_tokens(conn):
+    _auth_tokens_v5.create(conn, checkfirst=True)
+    columns = {c["name"] for c in inspect(conn).get_columns("users")}
+    if not {"verification_token", "reset_token", "reset_token_expires"} <= columns:
+        return
+    # Carry outstanding links over (hashed), then drop the plaintext columns.
+    now = datetime.utcnow()
+    rows = conn.execute(text(
+        "SELECT id, verification_token, reset_token, reset_token_expires FROM users "
+        "WHERE verification_token IS NOT NULL OR reset_token IS NOT NULL"
+    ).columns(reset_token_expires=DateTime)).all()
+    for user_id, verification_token, reset_token, reset_expires in rows:
+        if verification_token:
+            conn.execute(_auth_tokens_v5.insert().values(
+                token_hash=hash_token(verification_token), purpose="verify_email",
+                user_id=user_id, expires_at=now + timedelta(days=7), created_at=now))
+        if reset_token and reset_expires and reset_expires > now:
+            conn.execute(_auth_tokens_v5.insert().values(
+                token_hash=hash_token(reset_token), purpose="reset_password",
+                user_id=user_id, expires_at=reset_expires, created_at=now))
+    for column in ("verification_token", "reset_token", "reset_token_expires"):
+        conn.execute(text(f"ALTER TABLE users DROP COLUMN {column}"))
+
+
+@migration(6, "analyses.user_id", transactional=False)
+def _analysis_user_id(conn):
+    # Same schema as shipped; the indexes are now built and dropped online.
+    with conn.begin():
+        add_column(conn, "analyses", "user_id", "INTEGER REFERENCES users(id)")
+    online_ddl(conn, "CREATE INDEX {concurrently}IF NOT EXISTS ix_analyses_user_id_created ON analyses (user_id, created_at, id)")
+    online_ddl(conn, "DROP INDEX {concurrently}IF EXISTS ix_analyses_user_created")  # restored by migration 11
+
+
+@migration(7, "backfill analyses.user_id", transactional=False)
+def _backfill_analysis_user_id(conn, batch: int = BACKFILL_BATCH):
+    # Workers still on the previous release keep writing rows without
+    # user_id until the rollout completes; run `--backfill` afterwards.
+    # Short transactions of `batch` rows, so live traffic is never blocked
+    # behind one table-wide UPDATE; rerunning continues where it stopped.
+    step = text(
+        "UPDATE analyses SET user_id = (SELECT users.id FROM users WHERE users.email = analyses.user_email) "
+        "WHERE id IN (SELECT a.id FROM analyses a JOIN users u ON u.email = a.user_email "
+        "WHERE a.user_id IS NULL ORDER BY a.id LIMIT :batch)"
+    )
+    total = 0
+    while True:
+        with conn.begin():
+            updated = conn.execute(step, {"batch": batch}).rowcount
+        total += updated
+        if updated < batch:
+            break
+    print(f"Backfilled user_id on {total} analyses")
+
+
+@migration(8, "account deletion queue")
+def _account_deletions(conn):
+    add_column(conn, "users", "deleted_at", "TIMESTAMP")
+    _account_deletions_v8.create(conn, checkfirst=True)
+
+
+@migration(9, "analysis stats rollup")
+def _analysis_stats(conn):
+    _analysis_stats_v9.create(conn, checkfirst=True)
+
+
+@migration(10, "backfill analysis stats", transactional=False)
+def _backfill_analysis_stats(conn):
+    print(f"Backfilled analysis stats for {analysis_stats.rebuild(conn)} users")
+
+
+@migration(11, "restore email history index", transactional=False)
+def _restore_email_index(conn):
+    # Migration 6 dropped it while previous-release workers still page history
+    # by user_email. Drop it in a later release, once every worker runs the
+    # user_id code.
+    online_ddl(conn, "CREATE INDEX {concurrently}IF NOT EXISTS ix_analyses_user_created ON analyses (user_email, created_at, id)")
+
+
+@migration(12, "forget emails of purged accounts")
+def _account_deletions_email_nullable(conn):
+    if conn.dialect.name == "sqlite":
+        # SQLite cannot drop NOT NULL in place; rebuild the (small) table.
+        conn.execute(text("DROP INDEX IF EXISTS ix_account_deletions_status"))
+        conn.execute(text("ALTER TABLE account_deletions RENAME TO account_deletions_v8"))
+        _account_deletions_v12.create(conn)
+        columns = "user_id, email, status, analyses_deleted, requested_at, updated_at, completed_at"
+        conn.execute(text(f"INSERT INTO account_deletions ({columns}) SELECT {columns} FROM account_deletions_v8"))
+        conn.execute(text("DROP TABLE account_deletions_v8"))
+    else:
+        conn.execute(text("ALTER TABLE account_deletions ALTER COLUMN email DROP NOT NULL"))
+    conn.execute(text("UPDATE account_deletions SET email = NULL WHERE status = 'done'"))
+
+
+@migration(13, "index analyses not yet backfilled", transactional=False)
+def _legacy_email_index(conn):
+    # Partial index over rows still lacking user_id: history pages them in
+    # order next to the user_id index, and it is empty once --backfill has run.
+    online_ddl(conn, "CREATE INDEX {concurrently}IF NOT EXISTS ix_analyses_legacy_email "
+                     "ON analyses (user_email, created_at, id) WHERE user_id IS NULL")
+
+
+@migration(14, "blank bodies of finished emails")
+def _blank_finished_emails(conn):
+    # Sent and dead rows kept raw verify/reset links; the dispatcher now blanks them.
+    conn.execute(text("UPDATE email_outbox SET html = '' WHERE status IN ('sent', 'dead') AND html <> ''"))
+
+
+@migration(15, "move legacy analysis text into analysis_details", transactional=False)
+def _backfill_analysis_details(conn, batch: int = BACKFILL_BATCH):
+    # Rows written before analysis_details existed keep their full text inline.
+    # Each batch compresses it into analysis_details, fills preview, and clears
+    # analysis_text, in one short transaction; rerunning resumes.
+    analyses = _analyses_v1
+    total = 0
+    while True:
+        with conn.begin():
+            rows = conn.execute(
+                select(analyses.c.id, analyses.c.analysis_text, analyses.c.preview)
+                .where(analyses.c.analysis_text.is_not(None))
+                .order_by(analyses.c.id)
+                .limit(batch)
+            ).all()
+            if not rows:
+                break
+            ids = [r.id for r in rows]
+            existing = set(conn.execute(
+                select(_analysis_details_v1.c.analysis_id).where(_analysis_details_v1.c.analysis_id.in_(ids))
+            ).scalars())
+            details = [{"analysis_id": r.id, "body": zlib.compress(r.analysis_text.encode("utf-8"), 6)}
+                       for r in rows if r.id not in existing]
+            if details:
+                conn.execute(_analysis_details_v1.insert(), details)
+            conn.execute(
+                analyses.update().where(analyses.c.id == bindparam("rid"))
+                .values(analysis_text=None, preview=bindparam("new_preview")),
+                [{"rid": r.id, "new_preview": r.preview if r.preview is not None else r.analysis_text[:200]} for r in rows],
+            )
+        total += len(rows)
+    print(f"Moved text of {total} legacy analyses into analysis_details")
+
+
+MIGRATIONS.sort(key=lambda m: m[0])
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(conn) -> int:
+    try:
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    except Exception:
+        conn.rollback()
+        return 0
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    conn.commit()
+
+
+def _record(conn, number: int, name: str):
+    conn.execute(text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                 {"v": number, "n": name, "t": datetime.utcnow()})
+
+
+def migrate(bind=engine) -> int:
+    """Apply pending migrations; returns the number applied."""
+    with bind.connect() as conn:
+        if current_version(conn) >= LATEST:
+            conn.rollback()
+            return 0
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+            conn.commit()
+        try:
+            _ensure_version_table(conn)
+            version = current_version(conn)  # another worker may have finished meanwhile
+            conn.rollback()
+            applied = 0
+            for number, name, step, transactional in MIGRATIONS:
+                if number <= version:
+                    continue
+                if transactional:
+                    with conn.begin():
+                        step(conn)
+                        _record(conn, number, name)
+                else:
+                    step(conn)
+                    with conn.begin():
+                        _record(conn, number, name)
+                print(f"✅ Migration {number} applied: {name}")
+                applied += 1
+            return applied
+        finally:
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+                conn.commit()
+
+
+if __name__ == "__main__":
+    if "--status" in sys.argv:
+        with engine.connect() as conn:
+            print(f"schema version {current_version(conn)} / latest {LATEST}")
+    elif "--backfill" in sys.argv:
+        with engine.connect() as conn:
+            _backfill_analysis_user_id(conn)
+            print(f"Rebuilt analysis stats for {analysis_stats.rebuild(conn)} users")
+    else:
+        print(f"{migrate()} migration(s) applied")
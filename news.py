@@ -0,0 +1,291 @@
+"""
+Background crypto news aggregator and persistent news store.
+
+Feeds are fetched concurrently on an interval with conditional GETs
+(ETag / If-Modified-Since), stream-parsed off the event loop, and published as
+an immutable snapshot. /news reads every page, the first included, from the
+store below so items always carry an id, ISO dates and a next_cursor; a stale
+snapshot only triggers a refresh in the background.
+
+Every parsed item is also tagged with tickers by an Aho-Corasick matcher and
+stored (deduplicated by URL hash) so /news?symbol=BTC&before=... can page
+through history with keyset queries on news_symbols.
+"""
+
+import io
+import os
+import time
+import asyncio
+import hashlib
+import xml.etree.ElementTree as ET
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import httpx
+import http_clients
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal, NewsItem, NewsSymbol
+import symbols
+
+FEEDS = [
+    "https://cointelegraph.com/rss",
+    "https://coindesk.com/arc/outboundfeeds/rss/",
+]
+REFRESH_SECONDS = int(os.getenv("NEWS_REFRESH_SECONDS", "120"))
+STALE_SECONDS = int(os.getenv("NEWS_STALE_SECONDS", str(REFRESH_SECONDS * 3)))
+ITEMS_PER_FEED = 10
+MAX_ITEMS = 25
+COLD_START_TIMEOUT = 10
+
+
+# Tickers/names that are ordinary English words are left out of the matcher.
+AMBIGUOUS_PATTERNS = {"op", "ton", "near", "link", "dot", "sui", "apt", "arb", "optimism"}
+EXTRA_PATTERNS = {"ether": "ETH", "binance coin": "BNB", "ripple": "XRP", "polkadot": "DOT", "chainlink": "LINK", "toncoin": "TON", "arbitrum": "ARB"}
+
+
+class SymbolTagger:
+    """Aho-Corasick automaton matching every pattern in one pass over the text."""
+
+    def __init__(self, patterns: dict):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pattern, ticker in patterns.items():
+            state = 0
+            for ch in pattern:
+                if ch not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][ch] = len(self.goto) - 1
+                state = self.goto[state][ch]
+            self.out[state].append((len(pattern), ticker))
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def tag(self, text: str) -> list:
+        text = text.lower()
+        state = 0
+        found = []
+        for i, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for length, ticker in self.out[state]:
+                start = i - length + 1
+                # Whole words only: "eth" must not match inside "method".
+                if (start == 0 or not text[start - 1].isalnum()) and (i + 1 == len(text) or not text[i + 1].isalnum()):
+                    if ticker not in found:
+                        found.append(ticker)
+        return found
+
+
+def _tag_patterns() -> dict:
+    patterns = {}
+    for base, name in symbols.CRYPTO_BASES.items():
+        for p in (base.lower(), name.lower()):
+            if p not in AMBIGUOUS_PATTERNS:
+                patterns.setdefault(p, base)
+    patterns.update(EXTRA_PATTERNS)
+    return patterns
+
+
+tagger = SymbolTagger(_tag_patterns())
+
+
+def parse_feed(content: bytes) -> list:
+    """Stream-parse an RSS document, clearing each <item> once it is read."""
+    items = []
+    source_name = ""
+    path = []
+    for event, elem in ET.iterparse(io.BytesIO(content), events=("start", "end")):
+        if event == "start":
+            path.append(elem.tag)
+            continue
+        path.pop()
+        if elem.tag == "title" and path[-1:] == ["channel"]:
+            source_name = (elem.text or "").strip()
+        elif elem.tag == "item":
+            title = elem.findtext("title", "").strip()
+            url = elem.findtext("link", "").strip()
+            pub_date = elem.findtext("pubDate", "").strip()
+            if title and url:
+                items.append({"title": title, "url": url, "source": source_name, "published_at": pub_date, "currencies": tagger.tag(title)})
+            elem.clear()
+    return items
+
+
+def _published(pub_date: str) -> datetime:
+    try:
+        dt = parsedate_to_datetime(pub_date)
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+    if dt.tzinfo:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def store_items(items: list) -> int:
+    """Insert unseen items (by URL hash) with their symbol tags; returns rows added."""
+    by_hash = {url_hash(i["url"]): i for i in items}
+    if not by_hash:
+        return 0
+    db = SessionLocal()
+    try:
+        existing = {h for (h,) in db.query(NewsItem.url_hash).filter(NewsItem.url_hash.in_(list(by_hash)))}
+        added = 0
+        for h, item in by_hash.items():
+            if h in existing:
+                continue
+            published_at = _published(item["published_at"])
+            row = NewsItem(url_hash=h, url=item["url"], title=item["title"], source=item["source"],
+                           symbols=",".join(item["currencies"]), published_at=published_at)
+            try:
+                with db.begin_nested():
+                    db.add(row)
+                    db.flush()
+                    for ticker in item["currencies"]:
+                        db.add(NewsSymbol(news_id=row.id, symbol=ticker, published_at=published_at))
+                    db.flush()
+                added += 1
+            except IntegrityError:
+                pass  # another worker stored it first
+        db.commit()
+        return added
+    finally:
+        db.close()
+
+
+def _news_symbol(symbol: str) -> str:
+    info = symbols.registry.get(symbol)
+    if info and info.asset_type == "crypto" and info.ccxt:
+        return info.ccxt.split("/")[0]
+    return symbol.upper().strip()
+
+
+def parse_cursor(before: str):
+    published, _, item_id = before.rpartition(",")
+    return datetime.fromisoformat(published), int(item_id)
+
+
+def query_news(db, symbol: str = "", before: str = "", limit: int = MAX_ITEMS) -> dict:
+    """Keyset page of stored news, newest first, optionally for one ticker."""
+    if symbol:
+        key_published, key_id = NewsSymbol.published_at, NewsSymbol.news_id
+        q = db.query(NewsItem).join(NewsSymbol, NewsSymbol.news_id == NewsItem.id).filter(NewsSymbol.symbol == _news_symbol(symbol))
+    else:
+        key_published, key_id = NewsItem.published_at, NewsItem.id
+        q = db.query(NewsItem)
+    if before:
+        ts, item_id = parse_cursor(before)
+        q = q.filter(or_(key_published < ts, and_(key_published == ts, key_id < item_id)))
+    rows = q.order_by(key_published.desc(), key_id.desc()).limit(limit).all()
+    news = [{
+        "id": r.id,
+        "title": r.title,
+        "url": r.url,
+        "source": r.source,
+        "published_at": r.published_at.isoformat(),
+        "currencies": [c for c in (r.symbols or "").split(",") if c],
+    } for r in rows]
+    next_cursor = f"{rows[-1].published_at.isoformat()},{rows[-1].id}" if len(rows) == limit else None
+    return {"news": news, "next_cursor": next_cursor}
+
+
+class NewsAggregator:
+    def __init__(self, feeds=FEEDS, refresh_seconds: int = REFRESH_SECONDS, client: httpx.AsyncClient = None):
+        self.feeds = feeds
+        self.refresh_seconds = refresh_seconds
+        self.client = client   # injected in tests; otherwise the shared "news" pool
+        self.validators = {}   # feed url -> {"etag": ..., "last_modified": ...}
+        self.feed_items = {}   # feed url -> last parsed items
+        self.snapshot = None   # {"news": [...]} — replaced, never mutated
+        self.updated_at = 0.0
+        self._task = None
+        self._refreshing = None
+
+    async def _fetch_feed(self, url: str):
+        headers = {}
+        v = self.validators.get(url, {})
+        if v.get("etag"):
+            headers["If-None-Match"] = v["etag"]
+        if v.get("last_modified"):
+            headers["If-Modified-Since"] = v["last_modified"]
+        try:
+            client = self.client or http_clients.get("news")
+            response = await client.get(url, headers=headers)
+            if response.status_code == 304:
+                return
+            response.raise_for_status()
+            items = await asyncio.to_thread(parse_feed, response.content)
+            self.feed_items[url] = items[:ITEMS_PER_FEED]
+            self.validators[url] = {
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+            }
+        except Exception as e:
+            # Keep serving the previous items for this feed.
+            print(f"News feed error ({url}): {e}")
+            return
+        try:
+            await asyncio.to_thread(store_items, items)
+        except Exception as e:
+            print(f"News store error ({url}): {e}")
+
+    async def refresh(self):
+        await asyncio.gather(*(self._fetch_feed(url) for url in self.feeds))
+        news = [item for url in self.feeds for item in self.feed_items.get(url, [])]
+        self.snapshot = {"news": news[:MAX_ITEMS]}
+        self.updated_at = time.time()
+
+    def _refresh_in_background(self):
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self.refresh())
+        return self._refreshing
+
+    async def _run(self):
+        while True:
+            try:
+                await self._refresh_in_background()
+            except Exception as e:
+                print(f"News refresh error: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def get(self) -> dict:
+        if self.snapshot is None:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._refresh_in_background()), COLD_START_TIMEOUT)
+            except asyncio.TimeoutError:
+                return {"news": [], "error": "News feeds timed out"}
+            except Exception as e:
+                return {"news": [], "error": str(e)}
+            return self.snapshot
+        if time.time() - self.updated_at > STALE_SECONDS:
+            self._refresh_in_background()
+        return self.snapshot
+
+
+aggregator = NewsAggregator()
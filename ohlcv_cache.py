@@ -0,0 +1,275 @@
+"""
+Disk-backed OHLCV cache shared by every worker on the host.
+
+Each (symbol, interval) pair gets its own directory of column-per-file .npy
+segments. Appends add a new segment, readers memory-map the segments and
+compaction folds them back into a single one, so the usual read is zero-copy.
+Segments and meta files are published with atomic renames; readers never
+take a lock and only see complete files.
+"""
+
+import os
+import json
+import time
+import shutil
+import uuid
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CACHE_DIR = os.getenv("OHLCV_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ohlcv_cache"))
+CACHE_ENABLED = os.getenv("OHLCV_CACHE_ENABLED", "1") != "0"
+MAX_BYTES = int(os.getenv("OHLCV_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+MAX_SEGMENTS = int(os.getenv("OHLCV_CACHE_MAX_SEGMENTS", "8"))
+FRESH_SECONDS = int(os.getenv("OHLCV_CACHE_TTL", "60"))
+RETAIN_BARS = int(os.getenv("OHLCV_CACHE_RETAIN_BARS", "10000"))
+
+COLUMNS = ["open", "high", "low", "close", "volume"]
+SEGMENT_PREFIX = "seg-"
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+
+
+class _KeyLock:
+    """Exclusive per-key writer lock (flock), shared across processes."""
+
+    def __init__(self, key_dir: str, blocking: bool = True):
+        self.path = os.path.join(key_dir, LOCK_FILE)
+        self.blocking = blocking
+        self.fd = None
+        self.acquired = False
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is None:
+            self.acquired = True
+            return self
+        flags = fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(self.fd, flags)
+            self.acquired = True
+        except BlockingIOError:
+            self.acquired = False
+        return self
+
+    def __exit__(self, *exc):
+        if self.acquired and fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        return False
+
+
+def _key_dir(symbol: str, interval: str) -> str:
+    return os.path.join(CACHE_DIR, f"{quote(symbol.upper(), safe='')}@{quote(interval, safe='')}")
+
+
+def _segments(key_dir: str) -> list:
+    try:
+        names = os.listdir(key_dir)
+    except FileNotFoundError:
+        return []
+    return sorted(os.path.join(key_dir, n) for n in names if n.startswith(SEGMENT_PREFIX))
+
+
+def _next_segment_name(key_dir: str) -> str:
+    existing = _segments(key_dir)
+    last = int(os.path.basename(existing[-1])[len(SEGMENT_PREFIX):]) if existing else 0
+    return os.path.join(key_dir, f"{SEGMENT_PREFIX}{last + 1:08d}")
+
+
+def _read_segment(seg_dir: str) -> dict:
+    cols = {"timestamp": np.load(os.path.join(seg_dir, "timestamp.npy"), mmap_mode="r")}
+    for c in COLUMNS:
+        cols[c] = np.load(os.path.join(seg_dir, f"{c}.npy"), mmap_mode="r")
+    return cols
+
+
+def _write_segment(key_dir: str, cols: dict) -> str:
+    tmp = os.path.join(key_dir, f".tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    os.makedirs(tmp)
+    try:
+        for name, arr in cols.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arr))
+        final = _next_segment_name(key_dir)
+        os.rename(tmp, final)
+        return final
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def _merge(parts: list) -> dict:
+    """Concatenate segments, sort by time and keep the newest row per timestamp."""
+    if len(parts) == 1:
+        return parts[0]
+    merged = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    order = np.argsort(merged["timestamp"], kind="stable")
+    ts = merged["timestamp"][order]
+    keep = np.ones(len(ts), dtype=bool)
+    keep[:-1] = ts[:-1] != ts[1:]
+    idx = order[keep]
+    return {k: v[idx] for k, v in merged.items()}
+
+
+def _read_columns(key_dir: str):
+    for _ in range(2):
+        try:
+            parts = [_read_segment(s) for s in _segments(key_dir)]
+            break
+        except FileNotFoundError:
+            # A compaction swapped segments underneath us; list again.
+            continue
+    else:
+        return None
+    if not parts:
+        return None
+    return _merge(parts)
+
+
+def _to_frame(cols: dict) -> pd.DataFrame:
+    index = pd.DatetimeIndex(pd.to_datetime(np.asarray(cols["timestamp"]), unit="ns", utc=True), name="timestamp")
+    # Series first: a dict of bare arrays is consolidated into one new block,
+    # which would copy every memory-mapped column.
+    return pd.DataFrame({c: pd.Series(cols[c], index=index, copy=False) for c in COLUMNS}, copy=False)
+
+
+def _write_meta(key_dir: str, meta: dict):
+    tmp = os.path.join(key_dir, f".meta-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(key_dir, META_FILE))
+
+
+def _read_meta(key_dir: str) -> dict:
+    try:
+        with open(os.path.join(key_dir, META_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def load(symbol: str, interval: str, since=None):
+    """Return cached bars as a DataFrame backed by memory-mapped arrays, or None."""
+    if not CACHE_ENABLED:
+        return None
+    key_dir = _key_dir(symbol, interval)
+    cols = _read_columns(key_dir)
+    if cols is None:
+        return None
+    try:
+        os.utime(key_dir)  # LRU recency, visible to every worker
+    except OSError:
+        pass
+    df = _to_frame(cols)
+    if since is not None:
+        since = pd.Timestamp(since)
+        since = since.tz_localize("UTC") if since.tzinfo is None else since.tz_convert("UTC")
+        df = df.iloc[df.index.searchsorted(since):]  # positional slice keeps the mmap view
+    return df
+
+
+def is_fresh(symbol: str, interval: str, ttl: int = None) -> bool:
+    if not CACHE_ENABLED:
+        return False
+    fetched_at = _read_meta(_key_dir(symbol, interval)).get("fetched_at")
+    return bool(fetched_at) and time.time() - fetched_at < (FRESH_SECONDS if ttl is None else ttl)
+
+
+def mark_fetched(symbol: str, interval: str):
+    """Record a successful fetch that returned no new bars (e.g. market closed)."""
+    if not CACHE_ENABLED:
+        return
+    key_dir = _key_dir(symbol, interval)
+    if os.path.isdir(key_dir):
+        _write_meta(key_dir, {"fetched_at": time.time()})
+
+
+def append(symbol: str, interval: str, df: pd.DataFrame):
+    """Append freshly fetched bars; rows older than the cached tail are dropped."""
+    if not CACHE_ENABLED or df is None or df.empty:
+        return
+    index = pd.DatetimeIndex(df.index)
+    index = index.tz_localize("UTC") if index.tz is None else index.tz_convert("UTC")
+    cols = {"timestamp": index.as_unit("ns").asi8.astype(np.int64)}
+    for c in COLUMNS:
+        cols[c] = df[c].to_numpy(dtype=np.float64)
+
+    key_dir = _key_dir(symbol, interval)
+    os.makedirs(key_dir, exist_ok=True)
+    with _KeyLock(key_dir):
+        segments = _segments(key_dir)
+        if segments:
+            last_ts = _read_segment(segments[-1])["timestamp"]
+            if len(last_ts):
+                mask = cols["timestamp"] >= last_ts[-1]
+                cols = {k: v[mask] for k, v in cols.items()}
+        if len(cols["timestamp"]):
+            _write_segment(key_dir, cols)
+        _write_meta(key_dir, {"fetched_at": time.time()})
+        if len(_segments(key_dir)) > MAX_SEGMENTS:
+            _compact_locked(key_dir)
+    evict()
+
+
+def _compact_locked(key_dir: str):
+    old = _segments(key_dir)
+    if len(old) <= 1:
+        return
+    cols = _read_columns(key_dir)
+    if cols is None:
+        return
+    _write_segment(key_dir, {k: np.asarray(v[-RETAIN_BARS:]) for k, v in cols.items()})
+    for seg in old:
+        shutil.rmtree(seg, ignore_errors=True)
+
+
+def compact(symbol: str, interval: str):
+    """Fold all segments of a key into one (keeping RETAIN_BARS) so reads become a single mmap."""
+    key_dir = _key_dir(symbol, interval)
+    if not os.path.isdir(key_dir):
+        return
+    with _KeyLock(key_dir):
+        _compact_locked(key_dir)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def evict(max_bytes: int = None):
+    """Drop least recently used keys until the cache fits the size budget."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    try:
+        entries = [e for e in os.scandir(CACHE_DIR) if e.is_dir()]
+    except FileNotFoundError:
+        return
+    sized = [(e.stat().st_mtime, e.path, _dir_size(e.path)) for e in entries]
+    total = sum(s for _, _, s in sized)
+    for _, path, size in sorted(sized):
+        if total <= max_bytes:
+            break
+        with _KeyLock(path, blocking=False) as lock:
+            if not lock.acquired:
+                continue
+            # Readers that already mapped these files keep their pages.
+            for seg in _segments(path):
+                shutil.rmtree(seg, ignore_errors=True)
+            try:
+                os.remove(os.path.join(path, META_FILE))
+            except FileNotFoundError:
+                pass
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        print(f"OHLCV cache evicted {os.path.basename(path)} ({size} bytes)")
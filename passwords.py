@@ -0,0 +1,60 @@
+"""
+Password hashing service.
+
+bcrypt runs in a small dedicated thread pool so it never blocks the event
+loop and at most PASSWORD_HASH_WORKERS hashes burn CPU at once, whether the
+caller is an async endpoint (await) or a sync one (the *_sync helpers).
+Changing BCRYPT_ROUNDS makes older hashes "deprecated"; verify_and_update
+returns a fresh hash on the next successful login so stored hashes migrate
+transparently. OAuth-only accounts have no password hash at all.
+"""
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = HASH_WORKERS):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    def _verify_and_update(self, password: str, hashed: str):
+        if not hashed:
+            return False, None
+        try:
+            return self.context.verify_and_update(password, hashed)
+        except ValueError:
+            # Not a recognised hash (e.g. legacy placeholder); treat as no password.
+            return False, None
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        ok, _ = await self.verify_and_update(password, hashed)
+        return ok
+
+    async def verify_and_update(self, password: str, hashed: str):
+        """(matches, new_hash_or_None); new_hash is set when the cost parameters changed."""
+        if not hashed:
+            return False, None
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self._verify_and_update, password, hashed)
+
+    def hash_sync(self, password: str) -> str:
+        return self.pool.submit(self.context.hash, password).result()
+
+    def verify_sync(self, password: str, hashed: str) -> bool:
+        return self.verify_and_update_sync(password, hashed)[0]
+
+    def verify_and_update_sync(self, password: str, hashed: str):
+        if not hashed:
+            return False, None
+        return self.pool.submit(self._verify_and_update, password, hashed).result()
+
+
+password_hasher = PasswordHasher()
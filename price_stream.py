@@ -0,0 +1,283 @@
+"""
+Live price stream: one upstream subscription per symbol, fanned out to clients.
+
+The hub opens a single exchange trade stream per symbol on the first
+subscriber and closes it after the last one leaves. Every client gets its own
+bounded queue; when a slow client falls behind, the oldest ticks are dropped
+so it always catches up to the latest price. Completed 1m bars built from the
+same trades are appended to the OHLCV disk cache.
+
+Requested names are resolved through the symbol registry, so aliases such as
+BTC and BTCUSDT share one upstream; anything that is not a known crypto pair
+is ignored.
+
+The fake random-walk feed is only used when PRICE_FEED=fake is set, and its
+bars never reach the cache. Without ccxt.pro the stream is unavailable.
+"""
+
+import os
+import time
+import random
+import asyncio
+import pandas as pd
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import ohlcv_cache
+from market_data import crypto_pair
+from symbols import registry as symbol_registry
+
+try:
+    import ccxt.pro as ccxtpro
+    CCXT_PRO_AVAILABLE = True
+except ImportError:
+    CCXT_PRO_AVAILABLE = False
+
+PRICE_FEED = os.getenv("PRICE_FEED", "ccxt")
+CLIENT_QUEUE_SIZE = int(os.getenv("PRICE_CLIENT_QUEUE_SIZE", "100"))
+MAX_SYMBOLS_PER_CLIENT = 20
+MAX_CONNECTIONS = int(os.getenv("PRICE_MAX_CONNECTIONS", "1000"))
+BAR_MS = 60_000
+
+router = APIRouter(tags=["Prices"])
+
+
+class CcxtProFeed:
+    """Binance trade stream through ccxt.pro websockets."""
+
+    live = True
+
+    def __init__(self):
+        self.exchange = None
+
+    async def watch(self, symbol: str):
+        if self.exchange is None:
+            self.exchange = ccxtpro.binance()
+        pair = crypto_pair(symbol)
+        while True:
+            trades = await self.exchange.watch_trades(pair)
+            for t in trades:
+                yield {"price": float(t["price"]), "amount": float(t["amount"] or 0), "ts": int(t["timestamp"])}
+
+    async def close(self):
+        if self.exchange is not None:
+            await self.exchange.close()
+            self.exchange = None
+
+
+class FakeFeed:
+    """Random-walk trades for local development and tests."""
+
+    live = False  # never persisted as market data
+
+    def __init__(self, interval: float = 0.5, start_price: float = 100.0):
+        self.interval = interval
+        self.start_price = start_price
+
+    async def watch(self, symbol: str):
+        price = self.start_price
+        while True:
+            await asyncio.sleep(self.interval)
+            price = max(0.01, price * (1 + random.uniform(-0.001, 0.001)))
+            yield {"price": round(price, 5), "amount": round(random.uniform(0.01, 1), 4), "ts": int(time.time() * 1000)}
+
+    async def close(self):
+        pass
+
+
+class _BarBuilder:
+    """Folds trades into 1m OHLCV bars; the first, partially observed bar is discarded."""
+
+    def __init__(self):
+        self.start = None
+        self.bar = None
+        self.partial = True
+
+    def add(self, tick: dict):
+        bar_start = tick["ts"] - tick["ts"] % BAR_MS
+        completed = None
+        if self.start is not None and bar_start > self.start:
+            if not self.partial:
+                completed = (self.start, self.bar)
+            self.partial = False
+            self.bar = None
+        self.start = bar_start
+        p, a = tick["price"], tick["amount"]
+        if self.bar is None:
+            self.bar = [p, p, p, p, a]
+        else:
+            self.bar[1] = max(self.bar[1], p)
+            self.bar[2] = min(self.bar[2], p)
+            self.bar[3] = p
+            self.bar[4] += a
+        return completed
+
+
+def _store_bar(symbol: str, bar_start: int, bar: list):
+    pair = crypto_pair(symbol)
+    cached = ohlcv_cache.load(pair, "1m")
+    if cached is None or cached.empty:
+        return
+    # Only extend a contiguous series; a gap would never be backfilled.
+    if int(cached.index[-1].value // 1_000_000) < bar_start - BAR_MS:
+        return
+    index = pd.to_datetime([bar_start], unit="ms", utc=True)
+    df = pd.DataFrame([bar], columns=ohlcv_cache.COLUMNS, index=index)
+    ohlcv_cache.append(pair, "1m", df)
+
+
+class PriceHub:
+    def __init__(self, feed):
+        self.feed = feed
+        self.subscribers = {}  # symbol -> set of client queues
+        self.upstreams = {}    # symbol -> asyncio.Task
+        self.latest = {}       # symbol -> last tick sent to clients
+        self.bars = {}
+        self.dropped = 0
+        self.connections = 0
+
+    def connect(self) -> asyncio.Queue:
+        self.connections += 1
+        return asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+
+    @staticmethod
+    def canonical(name: str):
+        """Registry symbol for a streamable (crypto) name, else None."""
+        info = symbol_registry.get(name)
+        return info.symbol if info and info.asset_type == "crypto" and info.ccxt else None
+
+    def subscribe(self, client: asyncio.Queue, name: str):
+        """Subscribe client to name; returns the canonical symbol, or None if unknown."""
+        symbol = self.canonical(name)
+        if symbol is None:
+            return None
+        subs = self.subscribers.setdefault(symbol, set())
+        subs.add(client)
+        if symbol not in self.upstreams:
+            self.upstreams[symbol] = asyncio.create_task(self._run_upstream(symbol))
+        if symbol in self.latest:
+            self._offer(client, self.latest[symbol])
+        return symbol
+
+    def unsubscribe(self, client: asyncio.Queue, name: str):
+        symbol = self.canonical(name) or name
+        subs = self.subscribers.get(symbol)
+        if not subs:
+            return
+        subs.discard(client)
+        if not subs:
+            del self.subscribers[symbol]
+            task = self.upstreams.pop(symbol, None)
+            if task:
+                task.cancel()
+            self.bars.pop(symbol, None)
+
+    def disconnect(self, client: asyncio.Queue):
+        self.connections -= 1
+        for symbol in [s for s, subs in self.subscribers.items() if client in subs]:
+            self.unsubscribe(client, symbol)
+
+    def _offer(self, client: asyncio.Queue, message: dict):
+        if client.full():
+            try:
+                client.get_nowait()  # drop the stalest tick
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        client.put_nowait(message)
+
+    def publish(self, symbol: str, tick: dict):
+        message = {"symbol": symbol, "price": tick["price"], "ts": tick["ts"]}
+        self.latest[symbol] = message
+        for client in list(self.subscribers.get(symbol, ())):
+            self._offer(client, message)
+        if not self.feed.live:
+            return
+        completed = self.bars.setdefault(symbol, _BarBuilder()).add(tick)
+        if completed:
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(None, _store_bar, symbol, *completed)
+
+    async def _run_upstream(self, symbol: str):
+        backoff = 1
+        while True:
+            try:
+                async for tick in self.feed.watch(symbol):
+                    self.publish(symbol, tick)
+                    backoff = 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Price feed error for {symbol}: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    async def close(self):
+        for task in self.upstreams.values():
+            task.cancel()
+        await asyncio.gather(*self.upstreams.values(), return_exceptions=True)
+        self.upstreams.clear()
+        self.subscribers.clear()
+        if self.feed is not None:
+            await self.feed.close()
+
+
+def _make_feed():
+    if PRICE_FEED == "fake":
+        return FakeFeed()
+    if CCXT_PRO_AVAILABLE:
+        return CcxtProFeed()
+    print("ccxt.pro is not installed; /ws/prices is unavailable (set PRICE_FEED=fake for development)")
+    return None
+
+
+hub = PriceHub(_make_feed())
+
+
+async def _pump(websocket: WebSocket, client: asyncio.Queue):
+    while True:
+        await websocket.send_json(await client.get())
+
+
+@router.websocket("/ws/prices")
+async def ws_prices(websocket: WebSocket, symbols: str = ""):
+    """Stream ticks. Subscribe via ?symbols=BTCUSDT,ETHUSDT or
+    {"action": "subscribe"|"unsubscribe", "symbols": [...]} messages."""
+    await websocket.accept()
+    if hub.feed is None:
+        await websocket.close(code=1013, reason="Price feed unavailable")
+        return
+    if hub.connections >= MAX_CONNECTIONS:
+        await websocket.close(code=1013, reason="Too many connections")
+        return
+    client = hub.connect()
+    subscribed = set()
+
+    def apply(action: str, names):
+        for name in names:
+            if not isinstance(name, str) or not name.strip():
+                continue
+            if action == "subscribe" and len(subscribed) < MAX_SYMBOLS_PER_CLIENT:
+                symbol = hub.subscribe(client, name)
+                if symbol:
+                    subscribed.add(symbol)
+            elif action == "unsubscribe":
+                hub.unsubscribe(client, name)
+                subscribed.discard(hub.canonical(name) or name)
+
+    sender = asyncio.create_task(_pump(websocket, client))
+    try:
+        apply("subscribe", symbols.split(","))
+        while True:
+            msg = await websocket.receive_json()
+            if not isinstance(msg, dict):
+                continue
+            names = msg.get("symbols") or []
+            if isinstance(names, str):
+                names = names.split(",")
+            elif not isinstance(names, list):
+                continue
+            apply(msg.get("action", "subscribe"), names)
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        sender.cancel()
+        hub.disconnect(client)
@@ -0,0 +1,94 @@
+"""
+Monthly analysis quota.
+
+The billing period starts at last_reset_at (or plan_started_at / created_at)
+and lasts PERIOD. Nothing is written when a period ends: reads compute the
+effective usage, and the next reservation starts the new period in the same
+statement.
+
+Workers admit analyses against slices reserved with reserve(): one
+conditional UPDATE ... RETURNING that only succeeds while
+analyses_used + analyses_reserved stays within the limit, so concurrent
+workers can never jointly pass it. Used units are later moved from
+analyses_reserved to analyses_used by settle(). A reservation carries a lease
+(reserved_until) that live workers renew when they settle; if a worker dies,
+its reservation lapses and is ignored, which bounds any over-admission by the
+slice it held.
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import update, case, func, or_, bindparam, Integer, Boolean
+from database import User
+
+PERIOD = timedelta(days=30)
+LEASE = timedelta(seconds=120)
+
+
+def period_start(user):
+    return user.last_reset_at or user.plan_started_at or user.created_at
+
+
+def period_expired(user, now: datetime = None) -> bool:
+    start = period_start(user)
+    return bool(start) and (now or datetime.utcnow()) - start >= PERIOD
+
+
+def effective_used(user, now: datetime = None) -> int:
+    """analyses_used for the current period, without writing a reset."""
+    return 0 if period_expired(user, now) else (user.analyses_used or 0)
+
+
+def _live_reserved(now):
+    lapsed = or_(User.reserved_until.is_(None), User.reserved_until < now)
+    return case((lapsed, 0), else_=func.coalesce(User.analyses_reserved, 0))
+
+
+async def reserve(db, user_id: int, limit: int, units: int = 1) -> bool:
+    """Reserve units of quota for this worker; False when they do not fit."""
+    now = datetime.utcnow()
+    expired = func.coalesce(User.last_reset_at, User.plan_started_at, User.created_at) <= now - PERIOD
+    used = func.coalesce(User.analyses_used, 0)
+    reserved = _live_reserved(now)
+    stmt = (
+        update(User)
+        .where(User.id == user_id, or_(expired, used + reserved + units <= limit))
+        .values(
+            analyses_used=case((expired, 0), else_=used),
+            analyses_reserved=case((expired, units), else_=reserved + units),
+            reserved_until=now + LEASE,
+            last_reset_at=case((expired, now), else_=User.last_reset_at),
+        )
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+    ok = (await db.execute(stmt)).scalar_one_or_none() is not None
+    await db.commit()
+    return ok
+
+
+async def settle(db, entries: list):
+    """Apply [{"uid", "used", "released", "renew"}] in one executemany.
+
+    used units move from analyses_reserved to analyses_used (negative used,
+    from refunds, moves them back), released units are returned, and renew
+    extends the lease for slices still held. Rows are updated in uid order so
+    concurrent settles from several workers cannot deadlock.
+    """
+    if not entries:
+        return
+    entries = sorted(entries, key=lambda e: e["uid"])
+    now = datetime.utcnow()
+    used = bindparam("used", type_=Integer)
+    remaining = _live_reserved(now) - used - bindparam("released", type_=Integer)
+    users = User.__table__
+    stmt = (
+        update(users)
+        .where(users.c.id == bindparam("uid", type_=Integer))
+        .values(
+            analyses_used=case((func.coalesce(users.c.analyses_used, 0) + used > 0, func.coalesce(users.c.analyses_used, 0) + used), else_=0),
+            analyses_reserved=case((remaining > 0, remaining), else_=0),
+            reserved_until=case((bindparam("renew", type_=Boolean), now + LEASE), else_=users.c.reserved_until),
+        )
+    )
+    await db.execute(stmt, entries)
+    await db.commit()
@@ -0,0 +1,161 @@
+"""
+Token-bucket rate limiting for the expensive auth endpoints.
+
+/login, /register, /forgot-password and /change-password each cost a bcrypt
+hash or an outbound email. Buckets are keyed by client IP and by target
+account, and the check runs as a route dependency, so an over-budget request
+is rejected with 429 before any hashing or DB work.
+
+The default backend is in-process. Set RATE_LIMIT_REDIS_URL to share buckets
+between workers/hosts through Redis (atomic Lua script).
+"""
+
+import os
+import time
+import hashlib
+import asyncio
+from collections import OrderedDict
+from fastapi import Depends, HTTPException, Request
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+# Reverse proxies in front of the app that append to X-Forwarded-For (0 = trust none).
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+MAX_MEMORY_KEYS = 100_000
+
+# scope -> {key kind: (burst capacity, period in seconds to refill it)}
+LIMITS = {
+    "login": {"ip": (20, 60), "account": (5, 60)},
+    "register": {"ip": (5, 3600), "account": (3, 3600)},
+    "forgot-password": {"ip": (5, 3600), "account": (3, 3600)},
+    "change-password": {"ip": (10, 3600), "account": (5, 3600)},
+}
+
+
+class MemoryBackend:
+    def __init__(self, max_keys: int = MAX_MEMORY_KEYS):
+        self.buckets = OrderedDict()  # key -> (tokens, last refill)
+        self.max_keys = max_keys
+        self._lock = asyncio.Lock()
+
+    async def consume(self, key: str, capacity: float, refill_per_sec: float, cost: float = 1.0) -> float:
+        """Take cost tokens; returns 0 if allowed, else seconds until it would be."""
+        async with self._lock:
+            now = time.monotonic()
+            tokens, last = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * refill_per_sec)
+            if tokens >= cost:
+                self.buckets[key] = (tokens - cost, now)
+                retry_after = 0.0
+            else:
+                self.buckets[key] = (tokens, now)
+                retry_after = (cost - tokens) / refill_per_sec
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+            return retry_after
+
+
+class RedisBackend:
+    SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local retry = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  retry = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry)
+"""
+
+    def __init__(self, url: str):
+        self.client = aioredis.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    async def consume(self, key: str, capacity: float, refill_per_sec: float, cost: float = 1.0) -> float:
+        result = await self.script(keys=[f"ratelimit:{key}"], args=[capacity, refill_per_sec, cost, time.time()])
+        return float(result)
+
+
+class RateLimiter:
+    def __init__(self, backend, limits: dict = LIMITS):
+        self.backend = backend
+        self.limits = limits
+
+    async def check(self, scope: str, ip: str, account: str = None):
+        rules = self.limits.get(scope, {})
+        for kind, value in (("ip", ip), ("account", account)):
+            if not value or kind not in rules:
+                continue
+            capacity, period = rules[kind]
+            key = f"{scope}:{kind}:{value}"
+            try:
+                retry_after = await self.backend.consume(key, capacity, capacity / period)
+            except Exception as e:
+                # A broken shared backend must not lock everybody out.
+                print(f"Rate limit backend error: {e}")
+                return
+            if retry_after > 0:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many attempts. Please try again later.",
+                    headers={"Retry-After": str(int(retry_after) + 1)},
+                )
+
+
+def _make_backend():
+    if REDIS_URL and REDIS_AVAILABLE:
+        return RedisBackend(REDIS_URL)
+    if REDIS_URL:
+        print("RATE_LIMIT_REDIS_URL set but redis is not installed; using in-process buckets")
+    return MemoryBackend()
+
+
+limiter = RateLimiter(_make_backend())
+
+
+def client_ip(request: Request) -> str:
+    """Address seen by the outermost trusted proxy.
+
+    Entries to the left of it in X-Forwarded-For are client-supplied and
+    could be rotated to dodge the IP bucket or spoofed to lock someone out.
+    """
+    forwarded = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+    if TRUSTED_PROXY_HOPS and len(forwarded) >= TRUSTED_PROXY_HOPS:
+        return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limited(scope: str, form_field: str = None, use_token: bool = False):
+    """Route dependency enforcing LIMITS[scope].
+
+    The account key is the given form field (lower-cased email) or, with
+    use_token, a hash of the bearer token, so no DB lookup is needed.
+    """
+    async def dependency(request: Request):
+        if not ENABLED:
+            return
+        account = None
+        if form_field:
+            form = await request.form()
+            account = (form.get(form_field) or "").strip().lower() or None
+        elif use_token:
+            auth = request.headers.get("authorization")
+            account = hashlib.sha256(auth.encode()).hexdigest()[:32] if auth else None
+        await limiter.check(scope, client_ip(request), account)
+    return Depends(dependency)
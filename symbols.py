@@ -0,0 +1,167 @@
+"""
+Symbol registry: canonical tickers, provider symbols, asset class, pip size
+and trading hours, built once at import.
+
+Lookups are a single dict hit on the normalised symbol or any alias. A sorted
+key list gives prefix search (bisect) for the /symbols/search autocomplete.
+Unknown symbols fall back to a base/quote heuristic in classify().
+"""
+
+from bisect import bisect_left
+from dataclasses import dataclass, field, asdict
+
+HOURS_CRYPTO = "24/7"
+HOURS_FOREX = "Sun 22:00 - Fri 22:00 UTC"
+HOURS_FUTURES = "Sun-Fri 23:00-22:00 UTC (daily break 22:00-23:00)"
+HOURS_US_EQUITY = "Mon-Fri 09:30-16:00 America/New_York"
+
+FIAT = ["USD", "EUR", "GBP", "JPY", "CHF", "AUD", "CAD", "NZD", "TRY"]
+CRYPTO_BASES = {
+    "BTC": "Bitcoin", "ETH": "Ethereum", "BNB": "BNB", "SOL": "Solana", "XRP": "XRP",
+    "DOGE": "Dogecoin", "ADA": "Cardano", "DOT": "Polkadot", "MATIC": "Polygon",
+    "PEPE": "Pepe", "SHIB": "Shiba Inu", "AVAX": "Avalanche", "LINK": "Chainlink",
+    "LTC": "Litecoin", "TRX": "TRON", "TON": "Toncoin", "ATOM": "Cosmos", "NEAR": "NEAR",
+    "ARB": "Arbitrum", "OP": "Optimism", "SUI": "Sui", "APT": "Aptos",
+}
+CRYPTO_QUOTES = ["USDT", "USDC", "USD", "EUR", "TRY", "BTC"]
+FOREX_PAIRS = [
+    "EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "USDCAD", "USDCHF", "NZDUSD", "USDTRY",
+    "EURGBP", "EURJPY", "EURCHF", "EURAUD", "EURCAD", "EURTRY", "GBPJPY", "GBPCHF",
+    "GBPAUD", "AUDJPY", "AUDNZD", "CADJPY", "CHFJPY", "NZDJPY",
+]
+COMMODITIES = [
+    # symbol, name, yfinance, pip size, aliases
+    ("XAUUSD", "Gold", "GC=F", 0.01, ["GOLD", "GC=F"]),
+    ("XAGUSD", "Silver", "SI=F", 0.001, ["SILVER", "SI=F"]),
+    ("USOIL", "WTI Crude Oil", "CL=F", 0.01, ["WTI", "OIL", "CL=F"]),
+    ("UKOIL", "Brent Crude Oil", "BZ=F", 0.01, ["BRENT", "BZ=F"]),
+    ("NATGAS", "Natural Gas", "NG=F", 0.001, ["NG=F"]),
+    ("XPTUSD", "Platinum", "PL=F", 0.01, ["PLATINUM", "PL=F"]),
+    ("COPPER", "Copper", "HG=F", 0.0001, ["HG=F"]),
+]
+INDICES = [
+    # Tracked through their ETFs on Yahoo
+    ("NASDAQ", "Nasdaq 100", "QQQ", ["NAS100", "NDX", "US100"]),
+    ("SP500", "S&P 500", "SPY", ["SPX", "US500"]),
+    ("DOW", "Dow Jones", "DIA", ["DJI", "US30"]),
+]
+STOCKS = {
+    "AAPL": "Apple", "MSFT": "Microsoft", "NVDA": "NVIDIA", "AMZN": "Amazon", "GOOGL": "Alphabet",
+    "META": "Meta Platforms", "TSLA": "Tesla", "AMD": "AMD", "NFLX": "Netflix", "INTC": "Intel",
+    "COIN": "Coinbase", "MSTR": "MicroStrategy", "JPM": "JPMorgan Chase", "V": "Visa",
+    "BA": "Boeing", "DIS": "Disney", "PLTR": "Palantir", "QQQ": "Invesco QQQ", "SPY": "SPDR S&P 500",
+    "DIA": "SPDR Dow Jones",
+}
+
+
+@dataclass
+class SymbolInfo:
+    symbol: str
+    name: str
+    asset_type: str
+    yfinance: str
+    ccxt: str = None
+    pip_size: float = 0.01
+    trading_hours: str = HOURS_US_EQUITY
+    aliases: list = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _normalise(symbol: str) -> str:
+    return symbol.upper().strip().replace(" ", "")
+
+
+class SymbolRegistry:
+    def __init__(self, entries):
+        self.by_key = {}
+        for info in entries:
+            for key in [info.symbol, *info.aliases]:
+                # First registration wins so canonical symbols beat aliases.
+                self.by_key.setdefault(_normalise(key), info)
+        self.keys = sorted(self.by_key)
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def get(self, symbol: str):
+        return self.by_key.get(_normalise(symbol)) if symbol else None
+
+    def search(self, prefix: str, limit: int = 10) -> list:
+        prefix = _normalise(prefix)
+        if not prefix:
+            return []
+        results, seen = [], set()
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix) and len(results) < limit:
+            info = self.by_key[self.keys[i]]
+            if info.symbol not in seen:
+                seen.add(info.symbol)
+                results.append(info)
+            i += 1
+        return results
+
+
+def _build_entries() -> list:
+    entries = []
+    for base, name in CRYPTO_BASES.items():
+        for quote in CRYPTO_QUOTES:
+            if base == quote:
+                continue
+            # Yahoo quotes stablecoin pairs as the USD pair.
+            yf_quote = "USD" if quote in ("USDT", "USDC") else quote
+            entries.append(SymbolInfo(
+                symbol=f"{base}{quote}", name=f"{name} / {quote}", asset_type="crypto",
+                yfinance=f"{base}-{yf_quote}", ccxt=f"{base}/{'USDT' if quote == 'USD' else quote}",
+                pip_size=0.01, trading_hours=HOURS_CRYPTO,
+                aliases=[f"{base}/{quote}", f"{base}-{quote}"] + ([base] if quote == "USDT" else []),
+            ))
+    for pair in FOREX_PAIRS:
+        entries.append(SymbolInfo(
+            symbol=pair, name=f"{pair[:3]} / {pair[3:]}", asset_type="forex", yfinance=f"{pair}=X",
+            pip_size=0.01 if pair.endswith("JPY") else 0.0001, trading_hours=HOURS_FOREX,
+            aliases=[f"{pair[:3]}/{pair[3:]}", f"{pair}=X"],
+        ))
+    for symbol, name, yf_symbol, pip, aliases in COMMODITIES:
+        entries.append(SymbolInfo(symbol=symbol, name=name, asset_type="commodity", yfinance=yf_symbol,
+                                  pip_size=pip, trading_hours=HOURS_FUTURES, aliases=aliases))
+    for symbol, name, yf_symbol, aliases in INDICES:
+        entries.append(SymbolInfo(symbol=symbol, name=name, asset_type="stock", yfinance=yf_symbol,
+                                  pip_size=0.01, aliases=aliases))
+    for symbol, name in STOCKS.items():
+        entries.append(SymbolInfo(symbol=symbol, name=name, asset_type="stock", yfinance=symbol))
+    return entries
+
+
+registry = SymbolRegistry(_build_entries())
+
+
+def classify(symbol: str) -> str:
+    """Asset type for a symbol: registry hit first, then a base/quote heuristic."""
+    info = registry.get(symbol)
+    if info:
+        return info.asset_type
+    s = _normalise(symbol)
+    if s.endswith("=F"):
+        return "commodity"
+    if s.endswith("=X"):
+        return "forex"
+    for quote in CRYPTO_QUOTES:
+        if s.endswith(quote) and len(s) > len(quote):
+            base = s[:-len(quote)].rstrip("/-")
+            if base in CRYPTO_BASES or quote in ("USDT", "USDC"):
+                return "crypto"
+    if len(s) == 6 and s[:3] in FIAT and s[3:] in FIAT:
+        return "forex"
+    return "stock"
+
+
+def yfinance_ticker(symbol: str) -> str:
+    info = registry.get(symbol)
+    return info.yfinance if info else _normalise(symbol)
+
+
+def ccxt_pair(symbol: str):
+    info = registry.get(symbol)
+    return info.ccxt if info else None
@@ -0,0 +1,53 @@
+"""ProviderRouter hedging and failover with offline StubProviders."""
+
+import time
+
+from market_providers import StubProvider, ProviderRouter, MIN_SAMPLES
+
+
+def _router(primary, secondary):
+    providers = {primary.name: primary, secondary.name: secondary}
+    return ProviderRouter(providers, {"default": [primary.name, secondary.name]})
+
+
+def _served_by(result):
+    return result["asset_info"]["provider"]
+
+
+def test_slow_primary_is_hedged_after_its_p90():
+    primary, secondary = StubProvider("primary", delay=0.5), StubProvider("secondary")
+    router = _router(primary, secondary)
+    # Recorded history: the primary usually answers within 50 ms.
+    primary._latencies.extend([0.05] * MIN_SAMPLES)
+    start = time.perf_counter()
+    assert _served_by(router.fetch("BTC", "1h", "crypto")) == "secondary"
+    assert time.perf_counter() - start < 0.4
+
+
+def test_primary_within_default_hedge_delay_is_not_hedged():
+    primary, secondary = StubProvider("primary", delay=0.2), StubProvider("secondary")
+    router = _router(primary, secondary)
+    assert _served_by(router.fetch("BTC", "1h", "crypto")) == "primary"
+    assert secondary.stats()["calls"] == 0
+
+
+def test_failing_primary_fails_over():
+    primary, secondary = StubProvider("primary", fail=True), StubProvider("secondary")
+    router = _router(primary, secondary)
+    assert _served_by(router.fetch("BTC", "1h", "crypto")) == "secondary"
+    assert primary.stats()["error_rate"] == 1.0
+
+
+def test_failing_primary_is_demoted():
+    primary, secondary = StubProvider("primary", fail=True), StubProvider("secondary")
+    router = _router(primary, secondary)
+    router.fetch("BTC", "1h", "crypto")
+    assert [p.name for p in router.candidates("crypto")] == ["secondary", "primary"]
+    calls = primary.stats()["calls"]
+    assert _served_by(router.fetch("ETH", "1h", "crypto")) == "secondary"
+    assert primary.stats()["calls"] == calls
+
+
+def test_all_providers_failing_returns_no_data():
+    router = _router(StubProvider("primary", fail=True), StubProvider("secondary", fail=True))
+    assert router.fetch("BTC", "1h", "crypto") == {}
@@ -0,0 +1,82 @@
+"""ReplicaRouter against two local SQLite databases (primary + replica)."""
+
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from database import ReplicaRouter
+
+
+def _database(path, marker):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE whoami (name TEXT)"))
+        conn.execute(text("INSERT INTO whoami VALUES (:name)"), {"name": marker})
+    return sessionmaker(bind=engine)
+
+
+def _served_by(session):
+    try:
+        return session.execute(text("SELECT name FROM whoami")).scalar()
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def databases(tmp_path):
+    return _database(tmp_path / "primary.db", "primary"), _database(tmp_path / "replica.db", "replica")
+
+
+def _router(databases, lag=0.0, **kwargs):
+    primary, replica = databases
+    probe = lag if callable(lag) else (lambda conn: lag)
+    return ReplicaRouter(primary, {"replica0": replica}, max_lag=2, check_seconds=0, lag_probe=probe, **kwargs)
+
+
+def test_reads_go_to_caught_up_replica(databases):
+    router = _router(databases, lag=0.5)
+    session = router.read_session()
+    assert session.info == {"replica": "replica0"}
+    assert _served_by(session) == "replica"
+    assert router.stats()["replica_reads"] == 1
+
+
+def test_lagging_replica_falls_back_to_primary(databases):
+    router = _router(databases, lag=30.0)
+    session = router.read_session()
+    assert "replica" not in session.info
+    assert _served_by(session) == "primary"
+    assert router.stats()["fallbacks"] == 1
+    assert router.stats()["healthy"] == []
+
+
+def test_unreachable_replica_falls_back_to_primary(databases):
+    def probe(conn):
+        raise ConnectionError("replica down")
+    router = _router(databases, lag=probe)
+    assert _served_by(router.read_session()) == "primary"
+    assert router.stats()["lag_seconds"] == {"replica0": None}
+
+
+def test_prefer_primary_skips_replicas(databases):
+    router = _router(databases)
+    assert _served_by(router.read_session(prefer_primary=True)) == "primary"
+    assert router.stats()["replica_reads"] == 0
+
+
+def test_replica_recovers_after_lag_clears(databases):
+    lag = {"value": 30.0}
+    router = _router(databases, lag=lambda conn: lag["value"])
+    assert _served_by(router.read_session()) == "primary"
+    lag["value"] = 0.0
+    assert _served_by(router.read_session()) == "replica"
+
+
+def test_no_replicas_reads_primary(databases):
+    primary, _ = databases
+    router = ReplicaRouter(primary, {})
+    assert _served_by(router.read_session()) == "primary"
@@ -0,0 +1,184 @@
+"""UsageLedger and quota against a local SQLite users table."""
+
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database import User
+import quota
+from usage_ledger import UsageLedger
+
+LIMIT = 100
+SLICE = 10
+
+
+class Store:
+    def __init__(self, path):
+        self.engine = create_engine(f"sqlite:///{path}")
+        User.__table__.create(self.engine)
+        self.session_factory = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{path}"), expire_on_commit=False)
+
+    def add_user(self, **values) -> User:
+        values = {"email": "trader@example.com", "analyses_limit": LIMIT, "analyses_used": 0, "analyses_reserved": 0,
+                  "created_at": datetime.utcnow(), **values}
+        with self.engine.begin() as conn:
+            uid = conn.execute(User.__table__.insert().values(**values)).inserted_primary_key[0]
+        return User(id=uid, **values)
+
+    def row(self, uid):
+        with self.engine.connect() as conn:
+            return conn.execute(select(User.analyses_used, User.analyses_reserved).where(User.id == uid)).one()
+
+    def update(self, uid, **values):
+        with self.engine.begin() as conn:
+            conn.execute(update(User).where(User.id == uid).values(**values))
+
+    def lapse_lease(self, uid):
+        self.update(uid, reserved_until=datetime.utcnow() - timedelta(seconds=1))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return Store(tmp_path / "quota.db")
+
+
+def _ledger(store):
+    return UsageLedger(slice_size=SLICE, session_factory=store.session_factory)
+
+
+async def _admit_all(ledger, user, limit=LIMIT) -> int:
+    admitted = 0
+    while await ledger.admit(user, limit):
+        admitted += 1
+    return admitted
+
+
+def test_live_workers_admit_exactly_the_limit(store):
+    user = store.add_user()
+
+    async def scenario():
+        workers = [_ledger(store), _ledger(store)]
+        admitted = 0
+        for i in range(3 * LIMIT):
+            worker = workers[i % 2]
+            if await worker.admit(user, LIMIT):
+                admitted += 1
+            if i % 7 == 0:
+                await worker.flush()
+        for worker in workers:
+            await worker.stop()
+        return admitted
+
+    assert asyncio.run(scenario()) == LIMIT
+    assert tuple(store.row(user.id)) == (LIMIT, 0)
+
+
+def test_crashed_worker_over_admits_at_most_one_slice(store):
+    user = store.add_user()
+
+    async def scenario():
+        crashed = _ledger(store)
+        admitted = sum([await crashed.admit(user, LIMIT) for _ in range(3)])
+        # The worker dies without settling; its reservation blocks the slice
+        # until the lease lapses.
+        survivor = _ledger(store)
+        blocked = await _admit_all(survivor, user)
+        await survivor.stop()
+        store.lapse_lease(user.id)
+        fresh = _ledger(store)
+        after_lapse = await _admit_all(fresh, user)
+        await fresh.stop()
+        return admitted, blocked, after_lapse
+
+    admitted, blocked, after_lapse = asyncio.run(scenario())
+    assert blocked == LIMIT - SLICE
+    assert after_lapse == SLICE
+    assert admitted + blocked + after_lapse <= LIMIT + SLICE
+
+
+def test_refund_after_settle_returns_the_unit(store):
+    user = store.add_user()
+
+    async def scenario():
+        ledger = _ledger(store)
+        assert await ledger.admit(user, LIMIT)
+        await ledger.flush()
+        assert tuple(store.row(user.id)) == (1, SLICE - 1)
+        ledger.refund(user.id)
+        assert ledger.pending(user.id) == -1
+        await ledger.flush()
+        assert tuple(store.row(user.id)) == (0, SLICE)
+        await ledger.stop()
+
+    asyncio.run(scenario())
+    assert tuple(store.row(user.id)) == (0, 0)
+
+
+def test_lapsed_lease_is_not_counted(store):
+    user = store.add_user()
+
+    async def scenario():
+        ledger = _ledger(store)
+        assert await ledger.admit(user, LIMIT)
+        store.lapse_lease(user.id)
+        async with store.session_factory() as db:
+            assert await quota.reserve(db, user.id, LIMIT, LIMIT)
+        # Settling after the lapse never drives the reservation negative.
+        await ledger.flush(release_all=True)
+
+    asyncio.run(scenario())
+    used, reserved = store.row(user.id)
+    assert used == 1
+    assert 0 <= reserved <= LIMIT
+
+
+def test_period_rollover_while_slices_are_held(store):
+    user = store.add_user(last_reset_at=datetime.utcnow())
+
+    async def scenario():
+        old = _ledger(store)
+        held = sum([await old.admit(user, LIMIT) for _ in range(2)])
+        store.update(user.id, analyses_used=LIMIT - SLICE, last_reset_at=datetime.utcnow() - quota.PERIOD)
+        new = _ledger(store)
+        fresh = await _admit_all(new, user)
+        held += sum([await old.admit(user, LIMIT) for _ in range(SLICE)])
+        for ledger in (old, new):
+            await ledger.stop()
+        return held, fresh
+
+    held, fresh = asyncio.run(scenario())
+    # The rollover drops the old reservation, so the new period admits the
+    # full limit while the old worker finishes its slice: one slice over.
+    assert fresh == LIMIT
+    assert held == SLICE
+    assert tuple(store.row(user.id)) == (fresh + held, 0)
+    assert fresh + held <= LIMIT + SLICE
+
+
+def test_failed_flush_keeps_the_counts(store):
+    user = store.add_user()
+
+    def broken_factory():
+        raise ConnectionError("database unavailable")
+
+    async def scenario():
+        ledger = _ledger(store)
+        for _ in range(4):
+            assert await ledger.admit(user, LIMIT)
+        ledger.session_factory = broken_factory
+        with pytest.raises(ConnectionError):
+            await ledger.flush(release_all=True)
+        assert ledger.pending(user.id) == 4
+        assert ledger.accounts[user.id].granted == SLICE - 4
+        ledger.session_factory = store.session_factory
+        await ledger.stop()
+
+    asyncio.run(scenario())
+    assert tuple(store.row(user.id)) == (4, 0)
@@ -0,0 +1,97 @@
+"""
+Email verification and password reset tokens.
+
+Only a SHA-256 hash of each token is stored, in auth_tokens under a unique
+index. A link lookup is therefore one index probe, and a leaked table does
+not reveal usable links (the outbox blanks an email's body once it is sent). Tokens are single-use: consuming one is a
+DELETE ... RETURNING that also checks purpose and expiry. A background sweep
+purges expired rows.
+"""
+
+import os
+import asyncio
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from database import SessionLocal, AuthToken
+
+VERIFY_EMAIL = "verify_email"
+RESET_PASSWORD = "reset_password"
+TTL = {
+    VERIFY_EMAIL: timedelta(days=7),
+    RESET_PASSWORD: timedelta(hours=1),
+}
+PURGE_SECONDS = int(os.getenv("TOKEN_PURGE_SECONDS", "3600"))
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue(db, user_id: int, purpose: str) -> str:
+    """Add a new token to the caller's transaction; returns the raw token for the link."""
+    token = secrets.token_urlsafe(32)
+    db.add(AuthToken(token_hash=hash_token(token), purpose=purpose, user_id=user_id,
+                     expires_at=datetime.utcnow() + TTL[purpose]))
+    return token
+
+
+def _consume_stmt(token: str, purpose: str):
+    return (
+        delete(AuthToken)
+        .where(AuthToken.token_hash == hash_token(token), AuthToken.purpose == purpose, AuthToken.expires_at > datetime.utcnow())
+        .returning(AuthToken.user_id)
+    )
+
+
+def consume(db, token: str, purpose: str):
+    """Use up a valid token; returns its user id, or None if unknown/expired."""
+    return db.execute(_consume_stmt(token, purpose)).scalar_one_or_none()
+
+
+async def consume_async(db, token: str, purpose: str):
+    return (await db.execute(_consume_stmt(token, purpose))).scalar_one_or_none()
+
+
+async def revoke_async(db, user_id: int, purpose: str):
+    await db.execute(delete(AuthToken).where(AuthToken.user_id == user_id, AuthToken.purpose == purpose))
+
+
+def purge_expired() -> int:
+    db = SessionLocal()
+    try:
+        deleted = db.query(AuthToken).filter(AuthToken.expires_at < datetime.utcnow()).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+class TokenSweeper:
+    def __init__(self, interval: int = PURGE_SECONDS):
+        self.interval = interval
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                deleted = await asyncio.to_thread(purge_expired)
+                if deleted:
+                    print(f"Purged {deleted} expired tokens")
+            except Exception as e:
+                print(f"Token purge error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+sweeper = TokenSweeper()
@@ -0,0 +1,154 @@
+"""
+Write-behind analysis usage.
+
+Each worker admits analyses against quota slices it has reserved in the
+users row (quota.reserve), counting them in memory. Every FLUSH_SECONDS the
+accumulated counts for all users are settled in one batched UPDATE, which
+also returns slices idle for IDLE_RELEASE_SECONDS and renews the lease on
+the rest. Shutdown settles everything and returns all unused slices.
+
+A heavy user therefore costs one users write per slice and per flush rather
+than one per analysis. Small quotas get one-unit slices, so a free user is
+still counted exactly. If a worker crashes, its unsettled counts are lost.
+Its reservation keeps those units blocked until the lease lapses, so at most
+one slice per user can be over-admitted.
+"""
+
+import os
+import time
+import asyncio
+from database import AsyncSessionLocal
+import auth_cache
+import quota
+
+SLICE_SIZE = int(os.getenv("USAGE_SLICE_SIZE", "10"))
+SLICE_FRACTION = 10  # never reserve more than a tenth of what is left
+FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "5"))
+IDLE_RELEASE_SECONDS = 60
+
+
+class _Account:
+    __slots__ = ("email", "granted", "used", "touched", "lock")
+
+    def __init__(self, email: str):
+        self.email = email
+        self.granted = 0   # reserved in the DB, not yet used
+        self.used = 0      # admitted here, not yet settled; negative after refunds of settled units
+        self.touched = time.monotonic()
+        self.lock = asyncio.Lock()
+
+
+class UsageLedger:
+    def __init__(self, slice_size: int = SLICE_SIZE, flush_seconds: float = FLUSH_SECONDS, session_factory=AsyncSessionLocal):
+        self.slice_size = slice_size
+        self.flush_seconds = flush_seconds
+        self.session_factory = session_factory
+        self.accounts = {}   # user id -> _Account
+        self._task = None
+        self.stats = {"admitted": 0, "denied": 0, "reservations": 0, "flushes": 0}
+
+    def _slice(self, user, limit: int) -> int:
+        remaining = limit - quota.effective_used(user)
+        return max(1, min(self.slice_size, remaining // SLICE_FRACTION))
+
+    async def _reserve(self, user, limit: int) -> int:
+        units = self._slice(user, limit)
+        async with self.session_factory() as db:
+            if await quota.reserve(db, user.id, limit, units):
+                return units
+            if units > 1 and await quota.reserve(db, user.id, limit, 1):
+                return 1
+        return 0
+
+    async def admit(self, user, limit: int) -> bool:
+        """Count one analysis for user if the quota allows it."""
+        account = self.accounts.get(user.id)
+        if account is None:
+            account = self.accounts[user.id] = _Account(user.email)
+        async with account.lock:
+            if account.granted == 0:
+                units = await self._reserve(user, limit)
+                if not units:
+                    self.stats["denied"] += 1
+                    return False
+                self.stats["reservations"] += 1
+                account.granted += units
+            account.granted -= 1
+            account.used += 1
+            account.touched = time.monotonic()
+            self.stats["admitted"] += 1
+            return True
+
+    def refund(self, user_id: int):
+        """Return an admitted analysis (request failed) to the worker's slice.
+
+        The unit may already have been settled by a flush during the request,
+        so used can go negative; the next settle then moves it back from
+        analyses_used to analyses_reserved.
+        """
+        account = self.accounts.get(user_id)
+        if account:
+            account.used -= 1
+            account.granted += 1
+
+    def pending(self, user_id: int) -> int:
+        """Unsettled usage on this worker (negative while refunds are pending)."""
+        account = self.accounts.get(user_id)
+        return account.used if account else 0
+
+    async def flush(self, release_all: bool = False):
+        now = time.monotonic()
+        entries, taken = [], {}
+        for user_id, account in list(self.accounts.items()):
+            release = account.granted if release_all or now - account.touched > IDLE_RELEASE_SECONDS else 0
+            if not account.used and not release and not account.granted:
+                if not account.lock.locked():
+                    del self.accounts[user_id]
+                continue
+            # Take the units out before awaiting, so admits keep counting freely.
+            used = account.used
+            account.used -= used
+            account.granted -= release
+            taken[user_id] = (used, release)
+            entries.append({"uid": user_id, "used": used, "released": release, "renew": account.granted > 0})
+        if not entries:
+            return
+        try:
+            async with self.session_factory() as db:
+                await quota.settle(db, entries)
+        except Exception:
+            for user_id, (used, release) in taken.items():
+                account = self.accounts.get(user_id)
+                if account:
+                    account.used += used
+                    account.granted += release
+            raise
+        self.stats["flushes"] += 1
+        for user_id, (used, _) in taken.items():
+            if used and user_id in self.accounts:
+                auth_cache.invalidate_user(self.accounts[user_id].email)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Usage flush error: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush(release_all=True)
+        except Exception as e:
+            print(f"Usage flush error: {e}")
+
+
+ledger = UsageLedger()
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Request, HTTPException, Header
 from sqlalchemy.orm import Session
 from database import User, SessionLocal
+import auth_cache
 from typing import Optional
 import hmac
 import hashlib
@@ -60,6 +61,7 @@ async def handle_order_created(data: dict):
             user.analyses_limit = PLAN_LIMITS[plan]
             user.analyses_used = 0
             db.commit()
+            auth_cache.invalidate_user(customer_email)
             print(f"✅ Order: {customer_email} → {plan}")
     finally:
         db.close()
@@ -84,6 +86,7 @@ async def handle_subscription_created(data: dict):
             user.analyses_limit = PLAN_LIMITS[plan]
             user.analyses_used = 0
             db.commit()
+            auth_cache.invalidate_user(customer_email)
             print(f"✅ Subscription: {customer_email} → {plan}")
     finally:
         db.close()